@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "books:catalog:version"
+RESPONSE_CACHE_STATS_KEYS = {
+    "hits": "books:response_cache:hits",
+    "misses": "books:response_cache:misses",
+    "not_modified": "books:response_cache:not_modified",
+}
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+# Checkouts and returns change these on every request, they are read from the
+# database even when the rest of a book comes from the cache, so lending does
+# not have to invalidate the catalog
+STOCK_FIELDS = ("inventory", "active_loans")
+
+
+def _initial_version() -> int:
+    # Starting from the clock means a version evicted from the cache
+    # never comes back lower than one that responses were cached under
+    return time.time_ns() // 1000
+
+
+def get_catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _bump() -> None:
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+
+
+def bump_catalog_version() -> None:
+    """
+    Invalidates everything cached for the catalog. Inside a transaction the
+    version goes up once more on commit, so nothing read before the commit
+    stays cached under the new version.
+    """
+    _bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(_bump)
+
+
+def _incr_stat(name: str) -> None:
+    key = RESPONSE_CACHE_STATS_KEYS[name]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_response_cache_stats() -> dict:
+    values = cache.get_many(RESPONSE_CACHE_STATS_KEYS.values())
+    stats = {
+        name: values.get(key, 0) for name, key in RESPONSE_CACHE_STATS_KEYS.items()
+    }
+    served = stats["hits"] + stats["not_modified"]
+    total = served + stats["misses"]
+    stats["hit_rate"] = round(served / total, 4) if total else None
+    stats["catalog_version"] = get_catalog_version()
+    return stats
+
+
+def fragment_key(serializer_class, pk, version) -> str:
+    name = f"{serializer_class.__module__}.{serializer_class.__qualname__}"
+    return f"books:fragment:{name}:{pk}:{version}"
+
+
+class CatalogVersionMixin:
+    """
+    Pins the catalog version for the whole request before anything is read
+    from the database, so cached fragments are never newer than their version
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        request.catalog_version = get_catalog_version()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["catalog_version"] = getattr(self.request, "catalog_version", None)
+        return context
+
+
+def _stock_items(data) -> list:
+    if not isinstance(data, dict):
+        return []
+    items = data["results"] if "results" in data else [data]
+    return [item for item in items if isinstance(item, dict) and "id" in item]
+
+
+def _refresh_stock(items, model) -> None:
+    """Overwrites the stock counts of cached items with their current values"""
+    if not items:
+        return
+    stock = {
+        pk: values
+        for pk, *values in model._default_manager.filter(
+            pk__in=[item["id"] for item in items]
+        ).values_list("pk", *STOCK_FIELDS)
+    }
+    for item in items:
+        if item["id"] in stock:
+            item.update(zip(STOCK_FIELDS, stock[item["id"]]))
+
+
+def _stock_digest(items) -> str:
+    stock = [[item["id"], *(item.get(name) for name in STOCK_FIELDS)] for item in items]
+    return hashlib.md5(repr(stock).encode("utf-8")).hexdigest()
+
+
+def cache_catalog_response(view_method):
+    """
+    Serves GET handlers of the catalog with ETag validation and keeps their
+    response data cached under the current catalog version. The stock counts
+    are re-read on every hit and are part of the ETag.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        version = getattr(request, "catalog_version", None) or get_catalog_version()
+        path_digest = hashlib.md5(request.get_full_path().encode("utf-8")).hexdigest()
+        key = (
+            f"books:response:{version}:{request.accepted_renderer.format}:{path_digest}"
+        )
+        data = cache.get(key)
+        if data is None:
+            outcome = "misses"
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+            items = _stock_items(response.data)
+        else:
+            outcome = "hits"
+            items = _stock_items(data)
+            _refresh_stock(items, self.queryset.model)
+            response = Response(data)
+
+        # No Last-Modified: a one-second timestamp cannot tell apart two
+        # writes within the same second, the ETag always can
+        etag = f'"{version}-{request.accepted_renderer.format}-{_stock_digest(items)}"'
+        if response.status_code == status.HTTP_200_OK:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                _incr_stat("not_modified")
+                return not_modified
+
+        _incr_stat(outcome)
+        response["ETag"] = etag
+        return response
+
+    return wrapper
@@ -0,0 +1,75 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from books.models import Author
+
+EXPORT_CHUNK_SIZE = 2000
+CSV_HEADER = (
+    "id",
+    "external_id",
+    "title",
+    "authors",
+    "cover",
+    "inventory",
+    "daily_fee",
+)
+
+
+class Echo:
+    """File-like object for csv.writer that hands back each written line"""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the books as CSV lines, authors come from the stored names"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    books = queryset.order_by("id").values_list(
+        "id",
+        "external_id",
+        "title",
+        "author_names",
+        "cover",
+        "inventory",
+        "daily_fee",
+    )
+    for book_id, external_id, title, authors, *rest in books.iterator(
+        chunk_size=chunk_size
+    ):
+        yield writer.writerow((book_id, external_id, title, ", ".join(authors), *rest))
+
+
+def export_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields one JSON object per book in the format accepted by the bulk import,
+    authors are prefetched once per chunk
+    """
+    books = queryset.order_by("id").prefetch_related(
+        Prefetch("authors", queryset=Author.objects.order_by("id"))
+    )
+    for book in books.iterator(chunk_size=chunk_size):
+        row = {
+            "id": book.id,
+            "external_id": book.external_id,
+            "title": book.title,
+            "authors": [
+                {"first_name": author.first_name, "last_name": author.last_name}
+                for author in book.authors.all()
+            ],
+            "cover": book.cover,
+            "inventory": book.inventory,
+            "daily_fee": book.daily_fee,
+        }
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+EXPORTERS = {
+    "csv": (export_csv, "text/csv"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+}
@@ -0,0 +1,164 @@
+import json
+
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from books.models import Author, Book
+from books.serializers import AuthorSerializer
+from books.signals import refresh_books
+
+IMPORT_BATCH_SIZE = 1000
+BOOK_IMPORT_FIELDS = ("title", "cover", "inventory", "daily_fee")
+
+
+class BookImportRowSerializer(serializers.Serializer):
+    external_id = serializers.CharField(max_length=64)
+    title = serializers.CharField(max_length=155)
+    authors = AuthorSerializer(many=True, required=False)
+    cover = serializers.ChoiceField(choices=Book.CoverChoices.choices)
+    inventory = serializers.IntegerField(min_value=0)
+    daily_fee = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0)
+
+
+def iter_ndjson(lines):
+    """Parses one JSON document per line, yielding the error for broken lines"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield error
+
+
+def import_books(rows, batch_size=IMPORT_BATCH_SIZE) -> dict:
+    """
+    Upserts books by external_id. Rows are validated one by one and written
+    in batches with bulk inserts/updates, invalid rows end up in the report.
+    """
+    report = {"created": 0, "updated": 0, "errors": []}
+    batch = {}
+
+    for index, row in enumerate(rows):
+        if isinstance(row, Exception):
+            report["errors"].append({"row": index, "errors": [f"Invalid JSON: {row}"]})
+            continue
+        if not isinstance(row, dict):
+            report["errors"].append({"row": index, "errors": ["Expected an object"]})
+            continue
+
+        serializer = BookImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            report["errors"].append({"row": index, "errors": serializer.errors})
+            continue
+
+        data = serializer.validated_data
+        if data["external_id"] in batch:
+            report["errors"].append(
+                {
+                    "row": index,
+                    "errors": {
+                        "external_id": ["Duplicate external_id in the same batch"]
+                    },
+                }
+            )
+            continue
+
+        batch[data["external_id"]] = (index, data)
+        if len(batch) >= batch_size:
+            _write_batch(batch, report)
+            batch = {}
+
+    if batch:
+        _write_batch(batch, report)
+    return report
+
+
+def _resolve_authors(names) -> dict:
+    """Maps (first_name, last_name) to author ids, creating missing authors"""
+    if not names:
+        return {}
+
+    def lookup():
+        found = {}
+        authors = (
+            Author.objects.filter(last_name__in={last for _, last in names})
+            .order_by("-id")
+            .values_list("id", "first_name", "last_name")
+        )
+        for author_id, first_name, last_name in authors:
+            if (first_name, last_name) in names:
+                found[(first_name, last_name)] = author_id
+        return found
+
+    found = lookup()
+    missing = [name for name in names if name not in found]
+    if missing:
+        Author.objects.bulk_create(
+            [Author(first_name=first, last_name=last) for first, last in missing]
+        )
+        found = lookup()
+    return found
+
+
+def _write_batch(batch, report) -> None:
+    try:
+        with transaction.atomic():
+            created, updated = _upsert_batch(batch)
+    except DatabaseError as error:
+        for index, _ in batch.values():
+            report["errors"].append({"row": index, "errors": [str(error)]})
+        return
+
+    report["created"] += created
+    report["updated"] += updated
+
+
+def _upsert_batch(batch):
+    names = dict.fromkeys(
+        (author["first_name"], author["last_name"])
+        for _, data in batch.values()
+        for author in data.get("authors", ())
+    )
+    author_ids = _resolve_authors(names)
+
+    existing = Book.objects.in_bulk(list(batch), field_name="external_id")
+    new_books = []
+    for external_id, (_, data) in batch.items():
+        book = existing.get(external_id)
+        if book is None:
+            book = Book(external_id=external_id)
+            new_books.append(book)
+        for field in BOOK_IMPORT_FIELDS:
+            setattr(book, field, data[field])
+
+    Book.objects.bulk_create(new_books)
+    Book.objects.bulk_update(existing.values(), BOOK_IMPORT_FIELDS)
+
+    book_ids = dict(
+        Book.objects.filter(external_id__in=list(batch)).values_list(
+            "external_id", "id"
+        )
+    )
+    through = Book.authors.through
+    with_authors = [
+        external_id for external_id, (_, data) in batch.items() if "authors" in data
+    ]
+    through.objects.filter(
+        book_id__in=[book_ids[external_id] for external_id in with_authors]
+    ).delete()
+    through.objects.bulk_create(
+        [
+            through(
+                book_id=book_ids[external_id],
+                author_id=author_ids[(author["first_name"], author["last_name"])],
+            )
+            for external_id in with_authors
+            for author in batch[external_id][1]["authors"]
+        ],
+        ignore_conflicts=True,
+    )
+
+    refresh_books(book_ids.values())
+    return len(new_books), len(existing)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.models import Book
+from books.signals import refresh_books
+
+
+class Command(BaseCommand):
+    help = "Recomputes Book.author_names and the search index for every book"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = 0
+        refreshed = 0
+
+        while True:
+            book_ids = list(
+                Book.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not book_ids:
+                break
+
+            with transaction.atomic():
+                refresh_books(book_ids)
+
+            refreshed += len(book_ids)
+            last_id = book_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} books"))
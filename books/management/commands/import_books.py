@@ -0,0 +1,42 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from books.importers import IMPORT_BATCH_SIZE, import_books, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = "Upserts books by external_id from a JSON list or an NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, '-' reads stdin")
+        parser.add_argument(
+            "--format",
+            choices=("json", "ndjson"),
+            help="Defaults to ndjson for .ndjson/.jsonl files and json otherwise",
+        )
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "ndjson" if path == "-" or path.endswith((".ndjson", ".jsonl")) else "json"
+        )
+
+        source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            rows = iter_ndjson(source) if file_format == "ndjson" else json.load(source)
+            report = import_books(rows, batch_size=options["batch_size"])
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        for error in report["errors"]:
+            self.stderr.write(json.dumps(error, default=str))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']}, updated {report['updated']}, "
+                f"failed {len(report['errors'])} books"
+            )
+        )
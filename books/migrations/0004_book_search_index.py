@@ -0,0 +1,39 @@
+from django.db import migrations
+
+SEARCH_TABLE = "books_book_search"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} "
+        f"USING fts5(title, authors, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, title, authors) "
+        f"SELECT b.id, b.title, COALESCE(("
+        f"SELECT group_concat(a.first_name || ' ' || a.last_name, ' ') "
+        f"FROM books_author a "
+        f"JOIN books_book_authors ba ON ba.author_id = a.id "
+        f"WHERE ba.book_id = b.id), '') "
+        f"FROM books_book b"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0003_rename_author_book_authors"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
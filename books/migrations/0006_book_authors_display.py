@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0005_book_title_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="authors_display",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+    ]
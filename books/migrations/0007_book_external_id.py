@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0006_book_authors_display"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
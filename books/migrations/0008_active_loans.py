@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0007_book_external_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="active_loans",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
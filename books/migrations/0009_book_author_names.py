@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+def fill_author_names(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    through = Book.authors.through
+    names = {}
+    rows = (
+        through.objects.order_by("author_id")
+        .values_list("book_id", "author__first_name", "author__last_name")
+        .iterator()
+    )
+    for book_id, first_name, last_name in rows:
+        names.setdefault(book_id, []).append(f"{first_name} {last_name}")
+
+    Book.objects.bulk_update(
+        [Book(pk=book_id, author_names=authors) for book_id, authors in names.items()],
+        ["author_names"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0008_active_loans"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="book",
+            name="authors_display",
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="author_names",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(fill_author_names, migrations.RunPython.noop),
+    ]
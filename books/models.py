@@ -1,5 +1,6 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import F
 
 
 class Author(models.Model):
@@ -18,20 +19,104 @@ class Author(models.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+class BookQuerySet(models.QuerySet):
+    def lend(self, copies: int = 1) -> int:
+        """
+        Takes copies off the shelf with a single conditional UPDATE, books
+        without enough copies are left untouched. Returns the number of books updated.
+        """
+        return self.filter(inventory__gte=copies).update(
+            inventory=F("inventory") - copies,
+            active_loans=F("active_loans") + copies,
+        )
+
+    def return_copies(self, copies: int = 1, held: int = 0) -> int:
+        """Ends loans, `held` of the copies go to holds instead of the shelf"""
+        return self.update(
+            inventory=F("inventory") + (copies - held),
+            active_loans=F("active_loans") - copies,
+        )
+
+    def lend_held(self, copies: int = 1) -> int:
+        """Lends copies that were set aside for holds, the shelf is untouched"""
+        return self.update(active_loans=F("active_loans") + copies)
+
+    def restock(self, copies: int = 1) -> int:
+        return self.update(inventory=F("inventory") + copies)
+
+    def refresh_author_names(self) -> dict:
+        """Recomputes the stored author names of the books, returns them by book id"""
+        stored = dict(self.values_list("pk", "author_names"))
+        names = {book_id: [] for book_id in stored}
+        through_rows = (
+            Book.authors.through.objects.filter(book_id__in=list(stored))
+            .order_by("author_id")
+            .values_list("book_id", "author__first_name", "author__last_name")
+        )
+        for book_id, first_name, last_name in through_rows:
+            names[book_id].append(f"{first_name} {last_name}")
+
+        stale_books = [
+            Book(pk=book_id, author_names=authors)
+            for book_id, authors in names.items()
+            if authors != stored[book_id]
+        ]
+        if stale_books:
+            Book.objects.bulk_update(stale_books, ["author_names"])
+        return names
+
+
 class Book(models.Model):
     class CoverChoices(models.TextChoices):
         HARD = "HARD"
         SOFT = "SOFT"
 
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
     title = models.CharField(
         max_length=155,
     )
     authors = models.ManyToManyField(Author, blank=True, related_name="books")
+    # Full names of the authors, so lists render without the authors table
+    author_names = models.JSONField(blank=True, default=list, editable=False)
     cover = models.CharField(max_length=10, choices=CoverChoices.choices)
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
+    # Copies out on loan, kept by lend()/return_copies()
+    active_loans = models.IntegerField(default=0, editable=False)
     daily_fee = models.DecimalField(
         max_digits=5, decimal_places=2, validators=[MinValueValidator(0)]
     )
 
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["title", "id"], name="books_book_title_id_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(active_loans__gte=0),
+                name="books_book_active_loans_gte_0",
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.title
+
+    def save(self, *args, **kwargs):
+        """
+        active_loans only changes through the F() updates of BookQuerySet,
+        so saving a stale instance never writes an older count back
+        """
+        if not self._state.adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.attname
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs["update_fields"] = [
+                field for field in update_fields if field != "active_loans"
+            ]
+        super().save(*args, **kwargs)
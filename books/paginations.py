@@ -1,6 +1,184 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class BookPagination(PageNumberPagination):
     page_size = 10
     max_page_size = 1000
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a unique composite key, e.g. ("title", "id").
+    Every page is a single indexed range query without OFFSET or COUNT,
+    so its cost doesn't depend on how deep the client has scrolled.
+
+    Setting `count_cache_timeout` lets clients ask for a total with
+    ?with_count=true, served from the cache for that many seconds.
+    """
+
+    ordering = ("id",)
+    count_query_param = "with_count"
+    count_cache_timeout = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.count = None
+        if (
+            self.count_cache_timeout is not None
+            and request.query_params.get(self.count_query_param, "").lower() == "true"
+        ):
+            self.count = self.get_cached_count(queryset)
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse, key = self.cursor if self.cursor else (False, None)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self._flip(field) for field in ordering)
+
+        queryset = self.filter_page(queryset, ordering, key)
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = key is not None
+
+        return self.page
+
+    def filter_page(self, queryset, ordering, key):
+        """The rows after `key`, in `ordering`"""
+        if key is not None:
+            try:
+                queryset = queryset.filter(self._keyset_condition(ordering, key))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset.order_by(*ordering)
+
+    def get_cached_count(self, queryset):
+        queryset = queryset.order_by()
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.md5(f"{sql}{params}".encode("utf-8")).hexdigest()
+        key = f"pagination:count:{digest}"
+
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def get_paginated_response(self, data):
+        if self.count is None:
+            return super().get_paginated_response(data)
+
+        return Response(
+            {
+                "count": self.count,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor((False, self._get_key(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor((True, self._get_key(self.page[0])))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            reverse, key = bool(cursor["r"]), list(cursor["k"])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if len(key) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, key
+
+    def encode_cursor(self, cursor):
+        reverse, key = cursor
+        data = json.dumps({"r": int(reverse), "k": key}, cls=DjangoJSONEncoder)
+        encoded = base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_key(self, instance):
+        return [getattr(instance, field.lstrip("-")) for field in self.ordering]
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def _keyset_condition(ordering, key):
+        """
+        Rows strictly after `key` in `ordering`, written as
+        a >= x AND (a > x OR (b >= y AND (b > y OR ...))),
+        so the leading column can be served by an index range scan.
+        """
+        condition = None
+        for field, value in reversed(list(zip(ordering, key))):
+            name = field.lstrip("-")
+            strict, inclusive = (
+                ("lt", "lte") if field.startswith("-") else ("gt", "gte")
+            )
+            after = Q(**{f"{name}__{strict}": value})
+            if condition is not None:
+                after = Q(**{f"{name}__{inclusive}": value}) & (after | condition)
+            condition = after
+        return condition
+
+
+class BookCursorPagination(KeysetPagination):
+    page_size = 10
+    max_page_size = 1000
+    ordering = ("title", "id")
+
+
+class CursorPaginationOptInMixin:
+    """
+    Switches a viewset to `cursor_pagination_class` when the client
+    asks for it with ?pagination=cursor
+    """
+
+    cursor_pagination_class = None
+    pagination_query_param = "pagination"
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            mode = self.request.query_params.get(self.pagination_query_param)
+            if mode == "cursor" and self.cursor_pagination_class is not None:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
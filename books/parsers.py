@@ -0,0 +1,17 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+from books.importers import iter_ndjson
+
+
+class NDJSONParser(BaseParser):
+    """Lazily parses newline-delimited JSON, one object per line"""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        return iter_ndjson(codecs.getreader(encoding)(stream))
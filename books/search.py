@@ -0,0 +1,82 @@
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from books.models import Book
+
+SEARCH_TABLE = "books_book_search"
+MIN_TERM_LENGTH = 3
+
+
+def is_available() -> bool:
+    """The FTS5 index only exists on SQLite, other backends fall back to LIKE"""
+    return connection.vendor == "sqlite"
+
+
+def index_books(book_ids) -> None:
+    """(Re)writes the search rows of the given books"""
+    book_ids = [book_id for book_id in book_ids if book_id is not None]
+    if not book_ids or not is_available():
+        return
+
+    placeholders = ", ".join(["%s"] * len(book_ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", book_ids
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, authors) "
+            f"SELECT id, title, "
+            f"(SELECT group_concat(value, ' ') FROM json_each(author_names)) "
+            f"FROM {Book._meta.db_table} WHERE id IN ({placeholders})",
+            book_ids,
+        )
+
+
+def unindex_books(book_ids) -> None:
+    book_ids = list(book_ids)
+    if not book_ids or not is_available():
+        return
+
+    placeholders = ", ".join(["%s"] * len(book_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", book_ids
+        )
+
+
+def filter_by_title(queryset, title: str):
+    """Substring title filter, served by the trigram index when possible"""
+    if not is_available() or len(title) < MIN_TERM_LENGTH or set("%_") & set(title):
+        return queryset.filter(title__icontains=title)
+
+    return queryset.filter(
+        id__in=RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE title LIKE %s",
+            (f"%{title}%",),
+        )
+    )
+
+
+def _match_expression(query: str) -> str:
+    """Turns free text into an FTS5 query where every term must match"""
+    terms = [term for term in query.split() if len(term) >= MIN_TERM_LENGTH]
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def search(queryset, query: str):
+    """Filters books by title and author names, best matches first"""
+    match = _match_expression(query)
+    if not is_available() or not match:
+        return filter_by_title(queryset, query)
+
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[
+            f"{SEARCH_TABLE}.rowid = {Book._meta.db_table}.id",
+            f"{SEARCH_TABLE} MATCH %s",
+        ],
+        params=[match],
+        select={"search_rank": f"{SEARCH_TABLE}.rank"},
+        order_by=["search_rank", "id"],
+    )
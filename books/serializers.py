@@ -1,8 +1,85 @@
+from django.core.cache import cache
 from rest_framework import serializers
 
+from books.cache import (
+    FRAGMENT_CACHE_TIMEOUT,
+    STOCK_FIELDS,
+    fragment_key,
+    get_catalog_version,
+)
 from books.models import Author, Book
 
 
+class CachedFragmentMixin:
+    """
+    Caches the rendered representation of each object per serializer class
+    and catalog version, so the same book is serialized once for every
+    response it appears in. Fields in `uncached_fields` are always taken from
+    the instance.
+    """
+
+    uncached_fields = ()
+
+    def to_representation(self, instance):
+        context = self.context
+        version = context.get("catalog_version") or get_catalog_version()
+        key = fragment_key(type(self), instance.pk, version)
+
+        fragments = context.get("fragments", {})
+        data = fragments[key] if key in fragments else cache.get(key)
+        if data is None:
+            data = super().to_representation(instance)
+            cache.set(key, data, FRAGMENT_CACHE_TIMEOUT)
+            if key in fragments:
+                fragments[key] = data
+        return self.fill_uncached_fields(data, instance)
+
+    def fill_uncached_fields(self, data, instance):
+        if not self.uncached_fields:
+            return data
+        data = data.copy()
+        for name in self.uncached_fields:
+            field = self.fields[name]
+            data[name] = field.to_representation(field.get_attribute(instance))
+        return data
+
+
+class FragmentListSerializer(serializers.ListSerializer):
+    """Fetches the cached fragments of a whole page in one cache round trip"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, "all") else data)
+        self.warm_fragments(items)
+        return super().to_representation(items)
+
+    def warm_fragments(self, items):
+        context = self.context
+        version = context.get("catalog_version") or get_catalog_version()
+        context["catalog_version"] = version
+
+        targets = []
+        if isinstance(self.child, CachedFragmentMixin):
+            targets.extend((type(self.child), item) for item in items)
+        for field in self.child.fields.values():
+            if isinstance(field, CachedFragmentMixin) and field.source != "*":
+                targets.extend(
+                    (type(field), field.get_attribute(item)) for item in items
+                )
+
+        keys = list(
+            dict.fromkeys(
+                fragment_key(serializer_class, obj.pk, version)
+                for serializer_class, obj in targets
+                if obj is not None
+            )
+        )
+        if keys:
+            found = cache.get_many(keys)
+            context.setdefault("fragments", {}).update(
+                {key: found.get(key) for key in keys}
+            )
+
+
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Author
@@ -22,15 +99,24 @@ class BookSerializer(serializers.ModelSerializer):
             "authors",
             "cover",
             "inventory",
+            "active_loans",
             "daily_fee",
         )
 
 
-class BookListSerializer(BookSerializer):
-    authors = serializers.SlugRelatedField(
-        many=True, read_only=True, slug_field="full_name"
+class BookListSerializer(CachedFragmentMixin, BookSerializer):
+    authors = serializers.ListField(
+        child=serializers.CharField(), source="author_names", read_only=True
     )
+    uncached_fields = STOCK_FIELDS
+
+    class Meta(BookSerializer.Meta):
+        list_serializer_class = FragmentListSerializer
 
 
-class BookDetailSerializer(BookSerializer):
+class BookDetailSerializer(CachedFragmentMixin, BookSerializer):
     authors = AuthorSerializer(many=True, read_only=True)
+    uncached_fields = STOCK_FIELDS
+
+    class Meta(BookSerializer.Meta):
+        list_serializer_class = FragmentListSerializer
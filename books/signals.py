@@ -0,0 +1,66 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from books import search
+from books.cache import bump_catalog_version
+from books.models import Author, Book
+
+
+def refresh_books(book_ids) -> dict:
+    """Brings the denormalized author names and the search index up to date"""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return {}
+
+    names = Book.objects.filter(pk__in=book_ids).refresh_author_names()
+    search.index_books(book_ids)
+    bump_catalog_version()
+    return names
+
+
+@receiver(post_save, sender=Book)
+def refresh_saved_book(sender, instance, **kwargs):
+    names = refresh_books([instance.pk])
+    instance.author_names = names.get(instance.pk, [])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    search.unindex_books([instance.pk])
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def refresh_books_with_changed_authors(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action == "pre_clear" and reverse:
+        instance._cleared_book_ids = list(instance.books.values_list("pk", flat=True))
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        names = refresh_books([instance.pk])
+        instance.author_names = names.get(instance.pk, [])
+    elif action == "post_clear":
+        refresh_books(instance.__dict__.pop("_cleared_book_ids", []))
+    else:
+        refresh_books(pk_set)
+
+
+@receiver(post_save, sender=Author)
+def refresh_books_of_saved_author(sender, instance, created, **kwargs):
+    if not created:
+        refresh_books(instance.books.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def remember_books_of_deleted_author(sender, instance, **kwargs):
+    instance._deleted_book_ids = list(instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def refresh_books_of_deleted_author(sender, instance, **kwargs):
+    refresh_books(instance.__dict__.pop("_deleted_book_ids", []))
@@ -0,0 +1,15 @@
+import os
+
+from books.exporters import EXPORTERS
+from books.models import Book
+from jobs.registry import task
+
+
+@task("books.export_catalog")
+def export_catalog(path, output="ndjson"):
+    """Writes the whole catalog to `path`, replacing the file once complete"""
+    exporter, _ = EXPORTERS[output]
+    partial = f"{path}.partial"
+    with open(partial, "w", newline="") as file:
+        file.writelines(exporter(Book.objects.all()))
+    os.replace(partial, path)
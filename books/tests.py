@@ -1,14 +1,26 @@
+import json
+import tempfile
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 from rest_framework import status
 
 from rest_framework.test import APIClient
 
+from books.cache import RESPONSE_CACHE_STATS_KEYS
 from books.models import Book, Author
 from books.serializers import BookListSerializer, BookDetailSerializer
 
 BOOK_URL = reverse("books:books-list")
+BOOK_BULK_URL = reverse("books:books-bulk")
+BOOK_EXPORT_URL = reverse("books:books-export")
 
 
 def sample_author(**params):
@@ -39,6 +51,7 @@ def book_detail_url(book_id):
 
 class UnauthenticatedBooksApiTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
 
     def test_list_books(self):
@@ -53,6 +66,22 @@ class UnauthenticatedBooksApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data["results"], serializer.data)
 
+    def test_list_books_renders_authors_as_list_of_full_names(self):
+        book = sample_book()
+        book.authors.add(
+            sample_author(first_name="John", last_name="Tolkien"),
+            sample_author(first_name="Clive", last_name="Lewis, Jr."),
+        )
+        sample_book(title="No authors")
+
+        res = self.client.get(BOOK_URL)
+
+        self.assertEqual(
+            [item["authors"] for item in res.data["results"]],
+            [["John Tolkien", "Clive Lewis, Jr."], []],
+        )
+        self.assertIn(b'"authors":["John Tolkien","Clive Lewis, Jr."]', res.content)
+
     def test_filter_books_by_authors(self):
         author1 = sample_author(first_name="Author1")
         author2 = sample_author(first_name="Author2")
@@ -90,6 +119,92 @@ class UnauthenticatedBooksApiTests(TestCase):
         self.assertIn(serializer2.data, res.data["results"])
         self.assertNotIn(serializer3.data, res.data["results"])
 
+    def test_search_books_by_title_and_authors(self):
+        author = sample_author(first_name="John", last_name="Tolkien")
+        book1 = sample_book(title="The Lord of the Rings")
+        book2 = sample_book(title="The Hobbit")
+        book3 = sample_book(title="No match")
+        book2.authors.add(author)
+
+        res = self.client.get(BOOK_URL, {"q": "tolkien"})
+        ids = [book["id"] for book in res.data["results"]]
+        self.assertEqual(ids, [book2.id])
+
+        res = self.client.get(BOOK_URL, {"q": "the"})
+        ids = [book["id"] for book in res.data["results"]]
+        self.assertIn(book1.id, ids)
+        self.assertIn(book2.id, ids)
+        self.assertNotIn(book3.id, ids)
+
+    def test_search_index_follows_author_changes(self):
+        author = sample_author(first_name="John", last_name="Tolkien")
+        book = sample_book(title="The Hobbit")
+        book.authors.add(author)
+
+        author.last_name = "Ronald"
+        author.save()
+
+        res = self.client.get(BOOK_URL, {"q": "tolkien"})
+        self.assertEqual(res.data["results"], [])
+
+        res = self.client.get(BOOK_URL, {"q": "ronald"})
+        self.assertEqual([b["id"] for b in res.data["results"]], [book.id])
+
+        author.books.clear()
+
+        res = self.client.get(BOOK_URL, {"q": "ronald"})
+        self.assertEqual(res.data["results"], [])
+
+    def test_search_ranks_best_matches_first(self):
+        weak_match = sample_book(title="Ring of fire and some other long words")
+        strong_match = sample_book(title="Ring")
+
+        res = self.client.get(BOOK_URL, {"q": "ring"})
+        ids = [book["id"] for book in res.data["results"]]
+
+        self.assertEqual(ids, [strong_match.id, weak_match.id])
+
+    def test_list_books_with_cursor_pagination(self):
+        titles = [f"Book {i:02}" for i in range(25)]
+        for title in reversed(titles):
+            sample_book(title=title)
+        sample_book(title="Book 05")
+
+        res = self.client.get(BOOK_URL, {"pagination": "cursor"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", res.data)
+        self.assertIsNone(res.data["previous"])
+
+        seen = []
+        pages = [res.data]
+        while res.data["next"]:
+            seen.extend(book["title"] for book in res.data["results"])
+            res = self.client.get(res.data["next"])
+            pages.append(res.data)
+        seen.extend(book["title"] for book in res.data["results"])
+
+        self.assertEqual(seen, sorted(titles + ["Book 05"]))
+        self.assertEqual(len(pages), 3)
+
+        res = self.client.get(pages[-1]["previous"])
+        self.assertEqual(res.data["results"], pages[-2]["results"])
+
+    def test_cursor_pagination_does_not_count(self):
+        for i in range(15):
+            sample_book(title=f"Book {i}")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(BOOK_URL, {"pagination": "cursor"})
+
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"])
+            self.assertNotIn("OFFSET", query["sql"])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(BOOK_URL, {"pagination": "cursor", "cursor": "bad"})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_retrieve_books_detail(self):
         book = sample_book()
         url = book_detail_url(book.id)
@@ -115,8 +230,192 @@ class UnauthenticatedBooksApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class BookQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.authors = [sample_author(first_name=f"Author{i}") for i in range(3)]
+
+    def create_books(self, number):
+        for i in range(number):
+            book = sample_book(title=f"Book {i}")
+            book.authors.add(*self.authors)
+
+    def test_list_query_count_does_not_grow_with_page(self):
+        self.create_books(2)
+        with self.assertNumQueries(2):
+            self.client.get(BOOK_URL)
+
+        self.create_books(8)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOK_URL)
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(len(res.data["results"]), 10)
+        for query in queries.captured_queries:
+            self.assertNotIn("books_author", query["sql"])
+
+    def test_filter_by_authors_query_count(self):
+        self.create_books(10)
+        author_ids = f"{self.authors[0].id},{self.authors[1].id}"
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOK_URL, {"authors": author_ids})
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(res.data["count"], 10)
+        for query in queries.captured_queries:
+            self.assertNotIn("DISTINCT", query["sql"])
+
+    def test_retrieve_query_count(self):
+        self.create_books(1)
+        book = Book.objects.get()
+
+        with self.assertNumQueries(2):
+            self.client.get(book_detail_url(book.id))
+
+
+class BookResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeated_list_is_served_from_cache(self):
+        sample_book()
+        self.client.get(BOOK_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 1)
+        # Only the stock counts are read, the rest of the page is cached
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"books_book"."inventory"', queries[0]["sql"])
+        self.assertNotIn('"books_book"."title"', queries[0]["sql"])
+
+    def test_list_hits_survive_a_checkout_of_another_book(self):
+        listed = sample_book(title="Listed")
+        other = sample_book(title="Other")
+        self.client.get(BOOK_URL, {"title": "Listed"})
+        etag = self.client.get(book_detail_url(listed.id))["ETag"]
+
+        Book.objects.filter(pk=other.pk).lend()
+        res = self.client.get(BOOK_URL, {"title": "Listed"})
+        self.assertEqual(res.data["results"][0]["id"], listed.id)
+        res = self.client.get(book_detail_url(listed.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        stats = cache.get_many(RESPONSE_CACHE_STATS_KEYS.values())
+        self.assertEqual(stats[RESPONSE_CACHE_STATS_KEYS["misses"]], 2)
+        self.assertEqual(stats[RESPONSE_CACHE_STATS_KEYS["hits"]], 1)
+        self.assertEqual(stats[RESPONSE_CACHE_STATS_KEYS["not_modified"]], 1)
+
+    def test_cached_list_shows_current_stock(self):
+        book = sample_book(inventory=2)
+        etag = self.client.get(BOOK_URL)["ETag"]
+
+        Book.objects.filter(pk=book.pk).lend()
+        res = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+        self.assertEqual(res.data["results"][0]["inventory"], 1)
+        self.assertEqual(res.data["results"][0]["active_loans"], 1)
+
+    def test_conditional_get_returns_not_modified(self):
+        book = sample_book()
+        url = book_detail_url(book.id)
+        res = self.client.get(url)
+        etag = res["ETag"]
+        self.assertFalse(res.has_header("Last-Modified"))
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        book.title = "New title"
+        book.save()
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+        self.assertEqual(res.data["title"], "New title")
+
+    def test_author_change_invalidates_cached_list(self):
+        author = sample_author(first_name="John", last_name="Tolkien")
+        book = sample_book()
+        book.authors.add(author)
+        self.client.get(BOOK_URL)
+
+        author.last_name = "Lewis"
+        author.save()
+        res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res.data["results"][0]["authors"], ["John Lewis"])
+
+    def test_cache_stats(self):
+        sample_book()
+        self.client.get(BOOK_URL)
+        self.client.get(BOOK_URL)
+        url = reverse("books:books-cache-stats")
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        admin = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.client.force_authenticate(admin)
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["hits"], 1)
+        self.assertEqual(res.data["misses"], 1)
+        self.assertEqual(res.data["hit_rate"], 0.5)
+
+
+class AuthorNamesTests(TestCase):
+    def test_author_names_follow_authors(self):
+        author1 = sample_author(first_name="John", last_name="Tolkien")
+        author2 = sample_author(first_name="Clive", last_name="Lewis")
+        book = sample_book()
+
+        book.authors.add(author1, author2)
+        self.assertEqual(book.author_names, ["John Tolkien", "Clive Lewis"])
+
+        author1.first_name = "J.R.R."
+        author1.save()
+        book.refresh_from_db()
+        self.assertEqual(book.author_names, ["J.R.R. Tolkien", "Clive Lewis"])
+
+        author2.delete()
+        book.refresh_from_db()
+        self.assertEqual(book.author_names, ["J.R.R. Tolkien"])
+
+        author1.books.remove(book)
+        book.refresh_from_db()
+        self.assertEqual(book.author_names, [])
+
+    def test_backfill_author_names(self):
+        author = sample_author(first_name="John", last_name="Tolkien")
+        books = [sample_book(title=f"Book {i}") for i in range(3)]
+        author.books.add(*books)
+        Book.objects.update(author_names=[])
+
+        call_command("backfill_author_names", "--batch-size", "2", stdout=StringIO())
+
+        self.assertEqual(
+            list(Book.objects.values_list("author_names", flat=True)),
+            [["John Tolkien"]] * 3,
+        )
+
+
 class AuthenticatedBookApiTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             "test@test.com",
@@ -141,6 +440,7 @@ class AuthenticatedBookApiTests(TestCase):
 
 class AdminBookApiTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             "admin@admin.com", "testpass", is_staff=True
@@ -231,3 +531,176 @@ class AdminBookApiTests(TestCase):
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+
+def import_row(external_id, **params):
+    defaults = {
+        "external_id": external_id,
+        "title": f"Title {external_id}",
+        "authors": [{"first_name": "John", "last_name": "Tolkien"}],
+        "cover": "SOFT",
+        "inventory": 3,
+        "daily_fee": "1.50",
+    }
+    defaults.update(params)
+    return defaults
+
+
+class BookBulkImportApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_import_forbidden_for_non_staff(self):
+        user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.client.force_authenticate(user)
+
+        res = self.client.post(BOOK_BULK_URL, [import_row("a")], format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_import_creates_and_updates_books(self):
+        existing = sample_book(external_id="b", title="Old title")
+        rows = [
+            import_row("a"),
+            import_row(
+                "b",
+                authors=[
+                    {"first_name": "John", "last_name": "Tolkien"},
+                    {"first_name": "Clive", "last_name": "Lewis"},
+                ],
+            ),
+        ]
+
+        res = self.client.post(BOOK_BULK_URL, rows, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {"created": 1, "updated": 1, "errors": []})
+        existing.refresh_from_db()
+        self.assertEqual(existing.title, "Title b")
+        self.assertEqual(existing.author_names, ["John Tolkien", "Clive Lewis"])
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Book.objects.get(external_id="a").inventory, 3)
+
+        res = self.client.get(BOOK_URL, {"q": "lewis"})
+        self.assertEqual([b["id"] for b in res.data["results"]], [existing.id])
+
+    def test_bulk_import_reports_invalid_rows(self):
+        rows = [
+            import_row("a"),
+            import_row("b", inventory=-1),
+            import_row("a"),
+            "not a book",
+        ]
+
+        res = self.client.post(BOOK_BULK_URL, rows, format="json")
+
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual([error["row"] for error in res.data["errors"]], [1, 2, 3])
+        self.assertIn("inventory", res.data["errors"][0]["errors"])
+
+    def test_bulk_import_ndjson(self):
+        body = "\n".join(
+            [json.dumps(import_row("a")), "{broken", json.dumps(import_row("b"))]
+        )
+
+        res = self.client.generic(
+            "POST", BOOK_BULK_URL, body, content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 2)
+        self.assertEqual([error["row"] for error in res.data["errors"]], [1])
+
+    def test_bulk_import_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as small_import:
+            self.client.post(
+                BOOK_BULK_URL, [import_row(f"s{i}") for i in range(5)], format="json"
+            )
+        with CaptureQueriesContext(connection) as large_import:
+            self.client.post(
+                BOOK_BULK_URL, [import_row(f"l{i}") for i in range(50)], format="json"
+            )
+
+        self.assertEqual(Book.objects.count(), 55)
+        self.assertLessEqual(len(large_import), len(small_import))
+
+    def test_import_books_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as file:
+            file.write(json.dumps(import_row("a")) + "\n")
+            file.write(json.dumps(import_row("b")) + "\n")
+            file.flush()
+
+            out = StringIO()
+            call_command("import_books", file.name, stdout=out, stderr=StringIO())
+
+        self.assertIn("Created 2, updated 0, failed 0", out.getvalue())
+        self.assertEqual(Book.objects.count(), 2)
+
+
+class BookExportApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_export_forbidden_for_non_staff(self):
+        user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.client.force_authenticate(user)
+
+        res = self.client.get(BOOK_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_csv_with_filters(self):
+        author = sample_author(first_name="John", last_name="Tolkien")
+        book = sample_book(title="The Hobbit", external_id="h1")
+        book.authors.add(author)
+        sample_book(title="No match")
+
+        res = self.client.get(BOOK_EXPORT_URL, {"title": "hobbit"})
+        lines = b"".join(res.streaming_content).decode().splitlines()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "text/csv")
+        self.assertEqual(
+            lines[0], "id,external_id,title,authors,cover,inventory,daily_fee"
+        )
+        self.assertEqual(
+            lines[1:], [f"{book.id},h1,The Hobbit,John Tolkien,HARD,2,0.50"]
+        )
+
+    def test_export_ndjson_round_trips_through_bulk_import(self):
+        author = sample_author(first_name="John", last_name="Tolkien")
+        for i in range(5):
+            book = sample_book(title=f"Book {i}", external_id=f"b{i}")
+            book.authors.add(author)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BOOK_EXPORT_URL, {"output": "ndjson"})
+            rows = [
+                json.loads(line)
+                for line in b"".join(res.streaming_content).decode().splitlines()
+            ]
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            rows[0]["authors"], [{"first_name": "John", "last_name": "Tolkien"}]
+        )
+
+        rows[0]["title"] = "Renamed"
+        res = self.client.post(BOOK_BULK_URL, rows, format="json")
+        self.assertEqual(res.data, {"created": 0, "updated": 5, "errors": []})
+        self.assertTrue(Book.objects.filter(external_id="b0", title="Renamed").exists())
+
+    def test_export_rejects_unknown_format(self):
+        res = self.client.get(BOOK_EXPORT_URL, {"output": "xml"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,17 +1,40 @@
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
+from books import search
+from books.cache import (
+    CatalogVersionMixin,
+    cache_catalog_response,
+    get_response_cache_stats,
+)
+from books.exporters import EXPORTERS
+from books.importers import BookImportRowSerializer, import_books
 from books.models import Book
-from books.paginations import BookPagination
+from books.paginations import (
+    BookCursorPagination,
+    BookPagination,
+    CursorPaginationOptInMixin,
+)
+from books.parsers import NDJSONParser
 from books.permissions import IsAdminOrReadOnly
 from books.serializers import BookSerializer, BookListSerializer, BookDetailSerializer
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(
+    CatalogVersionMixin, CursorPaginationOptInMixin, viewsets.ModelViewSet
+):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     pagination_class = BookPagination
+    cursor_pagination_class = BookCursorPagination
     permission_classes = (IsAdminOrReadOnly,)
 
     @staticmethod
@@ -23,17 +46,30 @@ class BookViewSet(viewsets.ModelViewSet):
         """Retrieve the books with filters"""
         title = self.request.query_params.get("title")
         authors = self.request.query_params.get("authors")
+        query = self.request.query_params.get("q")
 
         queryset = self.queryset
 
+        if self.action not in ("list", "export"):
+            queryset = queryset.prefetch_related("authors")
+
         if title:
-            queryset = queryset.filter(title__icontains=title)
+            queryset = search.filter_by_title(queryset, title)
+
+        if query:
+            queryset = search.search(queryset, query)
 
         if authors:
             authors_ids = self._params_to_ints(authors)
-            queryset = queryset.filter(authors__id__in=authors_ids)
+            queryset = queryset.filter(
+                Exists(
+                    Book.authors.through.objects.filter(
+                        book_id=OuterRef("pk"), author_id__in=authors_ids
+                    )
+                )
+            )
 
-        return queryset.distinct()
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -56,7 +92,95 @@ class BookViewSet(viewsets.ModelViewSet):
                 type=OpenApiTypes.STR,
                 description="Filter by book title (ex. ?title=Some_book)",
             ),
+            OpenApiParameter(
+                "q",
+                type=OpenApiTypes.STR,
+                description=(
+                    "Search by book title and author names, "
+                    "best matches first (ex. ?q=tolkien rings)"
+                ),
+            ),
+            OpenApiParameter(
+                "pagination",
+                type=OpenApiTypes.STR,
+                description=(
+                    "Use ?pagination=cursor for keyset pages ordered by title, "
+                    "with next/previous cursors and no total count"
+                ),
+            ),
         ]
     )
+    @cache_catalog_response
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
+
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="cache-stats",
+        permission_classes=[IsAdminUser],
+    )
+    def cache_stats(self, request):
+        """Hit/miss counters of the catalog response cache"""
+        return Response(get_response_cache_stats())
+
+    @extend_schema(
+        request=BookImportRowSerializer(many=True),
+        description=(
+            "Creates or updates books by external_id from a JSON list "
+            "or an application/x-ndjson stream. Responds with the number of "
+            "created and updated books and the errors of rejected rows"
+        ),
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="bulk",
+        permission_classes=[IsAdminUser],
+        parser_classes=[JSONParser, NDJSONParser],
+    )
+    def bulk(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = [rows]
+        report = import_books(rows)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "output",
+                type=OpenApiTypes.STR,
+                enum=tuple(EXPORTERS),
+                description="Export file format, csv by default (ex. ?output=ndjson)",
+            ),
+        ],
+        responses={(status.HTTP_200_OK, "text/csv"): OpenApiTypes.STR},
+        description=(
+            "Streams the whole catalog as CSV or NDJSON, "
+            "the title, authors and q filters of the list apply"
+        ),
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="export",
+        permission_classes=[IsAdminUser],
+    )
+    def export(self, request):
+        output = request.query_params.get("output", "csv").lower()
+        if output not in EXPORTERS:
+            raise ValidationError(
+                {"output": f"Unknown export format, use one of: {', '.join(EXPORTERS)}"}
+            )
+
+        exporter, content_type = EXPORTERS[output]
+        response = StreamingHttpResponse(
+            exporter(self.get_queryset()), content_type=content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="books.{output}"'
+        return response
@@ -1,5 +1,9 @@
 from django.contrib import admin
 
-from borrowings.models import Borrowing
+from borrowings.models import Borrowing, BorrowingHistory, Fine, Hold, OutboxEvent
 
 admin.site.register(Borrowing)
+admin.site.register(Fine)
+admin.site.register(BorrowingHistory)
+admin.site.register(Hold)
+admin.site.register(OutboxEvent)
@@ -0,0 +1,46 @@
+import datetime
+
+from django.db import transaction
+
+from borrowings.models import Borrowing, BorrowingHistory
+
+ARCHIVE_BATCH_SIZE = 1000
+HISTORY_FIELDS = (
+    "id",
+    "borrow_date",
+    "expected_return_date",
+    "actual_return_date",
+    "book_id",
+    "user_id",
+)
+
+
+def archivable(older_than_days: int, today=None):
+    """Borrowings returned more than `older_than_days` ago with no fine accruing"""
+    today = today or datetime.date.today()
+    return Borrowing.objects.filter(
+        actual_return_date__lt=today - datetime.timedelta(days=older_than_days)
+    ).exclude(fine__is_final=False)
+
+
+@transaction.atomic
+def archive_batch(older_than_days: int, batch_size=ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Moves one batch of old returned borrowings to the history table.
+    Each batch is its own short transaction, returns the number of rows moved.
+    """
+    rows = list(
+        archivable(older_than_days)
+        .select_for_update()
+        .order_by("id")
+        .values_list(*HISTORY_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+
+    BorrowingHistory.objects.bulk_create(
+        [BorrowingHistory(**dict(zip(HISTORY_FIELDS, row))) for row in rows],
+        ignore_conflicts=True,
+    )
+    Borrowing.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
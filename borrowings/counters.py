@@ -0,0 +1,86 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from books.models import Book
+from borrowings.models import Borrowing
+
+
+def group_by_amount(counts) -> dict:
+    """{id: amount} -> {amount: [ids]}, so each amount is one UPDATE"""
+    grouped = defaultdict(list)
+    for pk, amount in counts.items():
+        grouped[amount].append(pk)
+    return grouped
+
+
+def take_loans(user_id, loans=1) -> bool:
+    """
+    Adds loans to the user's counter with one conditional UPDATE.
+    Returns False if that would go over BORROWING_MAX_ACTIVE_LOANS.
+    """
+    users = get_user_model().objects.filter(pk=user_id)
+    limit = getattr(settings, "BORROWING_MAX_ACTIVE_LOANS", None)
+    if limit is not None:
+        users = users.filter(active_loans__lte=limit - loans)
+    return bool(users.update(active_loans=F("active_loans") + loans))
+
+
+def release_loans(loans_by_user) -> None:
+    for loans, user_ids in group_by_amount(loans_by_user).items():
+        get_user_model().objects.filter(pk__in=user_ids).update(
+            active_loans=F("active_loans") - loans
+        )
+
+
+def active_loans_subquery(field, borrowing_model=Borrowing):
+    """
+    Counts the open borrowings of the outer user or book, migrations pass
+    their historical Borrowing model
+    """
+    return Coalesce(
+        Subquery(
+            borrowing_model.objects.filter(
+                **{field: OuterRef("pk")}, actual_return_date__isnull=True
+            )
+            .order_by()
+            .values(field)
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def _drifted(model, field):
+    return (
+        model.objects.annotate(actual_loans=active_loans_subquery(field))
+        .exclude(active_loans=F("actual_loans"))
+        .values_list("pk", "active_loans", "actual_loans")
+    )
+
+
+def find_counter_drift() -> dict:
+    """Rows whose stored active_loans differ from the active borrowings"""
+    return {
+        "users": list(_drifted(get_user_model(), "user")),
+        "books": list(_drifted(Book, "book")),
+    }
+
+
+def fix_counter_drift(drift) -> None:
+    """Recounts the drifted rows, the count and the write are one UPDATE"""
+    user_ids = [pk for pk, _, _ in drift["users"]]
+    if user_ids:
+        get_user_model().objects.filter(pk__in=user_ids).update(
+            active_loans=active_loans_subquery("user")
+        )
+
+    book_ids = [pk for pk, _, _ in drift["books"]]
+    if book_ids:
+        Book.objects.filter(pk__in=book_ids).update(
+            active_loans=active_loans_subquery("book")
+        )
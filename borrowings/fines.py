@@ -0,0 +1,182 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    DateField,
+    DecimalField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from borrowings.models import Borrowing, BorrowingHistory, Fine, Watermark
+
+FINES_WATERMARK = "borrowings:fines:due_date"
+BALANCE_ORDERINGS = ("outstanding_fees", "active_loans", "overdue_loans")
+
+
+class DaysBetween(Func):
+    """Whole days from the second date to the first one"""
+
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(julianday(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            function="DATEDIFF",
+            template="%(function)s(%(expressions)s)",
+            arg_joiner=", ",
+            **extra_context,
+        )
+
+
+def _fine_values(days):
+    return {
+        "days_overdue": days,
+        "amount": ExpressionWrapper(
+            days * F("daily_fee"),
+            output_field=DecimalField(max_digits=8, decimal_places=2),
+        ),
+    }
+
+
+@transaction.atomic
+def accrue_fines(today=None, rescan=False) -> dict:
+    """
+    Opens fines for the borrowings that became overdue since the last run
+    and recomputes the open ones with set-based UPDATEs. Returned borrowings
+    get their final amount, so only currently overdue loans are touched.
+    Running it again on the same day changes nothing.
+    """
+    today = today or datetime.date.today()
+    watermark, _ = Watermark.objects.select_for_update().get_or_create(
+        name=FINES_WATERMARK, defaults={"value": datetime.date.min}
+    )
+    since = datetime.date.min if rescan else watermark.value
+
+    newly_overdue = (
+        Borrowing.objects.filter(
+            expected_return_date__gte=since, expected_return_date__lt=today
+        )
+        .filter(
+            Q(actual_return_date__isnull=True)
+            | Q(actual_return_date__gt=F("expected_return_date"))
+        )
+        .values_list("id", "expected_return_date", "book__daily_fee")
+    )
+    Fine.objects.bulk_create(
+        [
+            Fine(borrowing_id=borrowing_id, due_date=due_date, daily_fee=daily_fee)
+            for borrowing_id, due_date, daily_fee in newly_overdue.iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    open_fines = Fine.objects.filter(is_final=False)
+    returned_on = Subquery(
+        Borrowing.objects.filter(pk=OuterRef("borrowing_id")).values(
+            "actual_return_date"
+        )[:1]
+    )
+    finalized = open_fines.filter(borrowing__actual_return_date__isnull=False).update(
+        is_final=True,
+        **_fine_values(DaysBetween(returned_on, F("due_date"))),
+    )
+    accruing = open_fines.filter(borrowing__actual_return_date__isnull=True).update(
+        **_fine_values(
+            DaysBetween(Value(today, output_field=DateField()), F("due_date"))
+        )
+    )
+
+    watermark.value = max(watermark.value, today)
+    watermark.save(update_fields=["value"])
+    return {"finalized": finalized, "accruing": accruing}
+
+
+def user_balances(today=None):
+    """
+    Active loans, overdue loans and late fees per user in one GROUP BY over
+    users joined to their borrowings and fines. Final fines count with their
+    amount. Other late loans accrue days late × the daily fee their fine
+    snapshotted, or the book's fee until accrue_fines opens one. Fines of
+    archived borrowings are added from the history table the same way.
+    """
+    today = Value(today or datetime.date.today(), output_field=DateField())
+    money = DecimalField(max_digits=10, decimal_places=2)
+    active = Q(borrowing__actual_return_date__isnull=True)
+    overdue = active & Q(borrowing__expected_return_date__lt=today)
+    late = overdue | Q(
+        borrowing__actual_return_date__gt=F("borrowing__expected_return_date")
+    )
+    fee = Case(
+        When(borrowing__fine__is_final=True, then=F("borrowing__fine__amount")),
+        default=DaysBetween(
+            Coalesce("borrowing__actual_return_date", today),
+            F("borrowing__expected_return_date"),
+        )
+        * Coalesce("borrowing__fine__daily_fee", "borrowing__book__daily_fee"),
+        output_field=money,
+    )
+
+    archived = BorrowingHistory.objects.filter(user_id=OuterRef("pk"))
+    # Only borrowings without an open fine are archived, a fine they have is final
+    archived_fine = Fine.objects.filter(borrowing_id=OuterRef("id")).values("amount")
+    archived_fees = (
+        archived.filter(actual_return_date__gt=F("expected_return_date"))
+        .order_by()
+        .values("user_id")
+        .annotate(
+            total=Sum(
+                Coalesce(
+                    Subquery(archived_fine[:1]),
+                    DaysBetween(F("actual_return_date"), F("expected_return_date"))
+                    * F("book__daily_fee"),
+                    output_field=money,
+                )
+            )
+        )
+        .values("total")
+    )
+
+    return (
+        get_user_model()
+        .objects.filter(
+            Exists(Borrowing.objects.filter(user_id=OuterRef("pk"))) | Exists(archived)
+        )
+        .values("email", user_id=F("id"))
+        .annotate(
+            active_loans=Count("borrowing", filter=active),
+            overdue_loans=Count("borrowing", filter=overdue),
+            outstanding_fees=ExpressionWrapper(
+                Coalesce(Sum(fee, filter=late), Value(0, output_field=money))
+                + Coalesce(Subquery(archived_fees), Value(0, output_field=money)),
+                output_field=money,
+            ),
+        )
+        .order_by("-outstanding_fees", "user_id")
+    )
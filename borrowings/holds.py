@@ -0,0 +1,93 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from books.models import Book
+from borrowings.counters import group_by_amount
+from borrowings.models import Hold
+
+EXPIRE_BATCH_SIZE = 500
+
+
+def allocate_copies(copies_by_book: Counter) -> Counter:
+    """
+    Hands free copies to the heads of the hold queues of their books,
+    returns how many copies each book handed out
+    """
+    book_ids = list(copies_by_book)
+    if len(book_ids) > 1:
+        book_ids = (
+            Hold.objects.waiting()
+            .filter(book_id__in=book_ids)
+            .order_by()
+            .values_list("book_id", flat=True)
+            .distinct()
+        )
+
+    allocated = Counter()
+    for book_id in book_ids:
+        popped = Hold.objects.pop(book_id, copies_by_book[book_id])
+        if popped:
+            allocated[book_id] = popped
+    return allocated
+
+
+def release_copies(copies_by_book: Counter) -> None:
+    """Copies of cancelled or expired holds go to the next hold or the shelf"""
+    allocated = allocate_copies(copies_by_book)
+    shelved = copies_by_book - allocated
+    for copies, book_ids in group_by_amount(shelved).items():
+        Book.objects.filter(pk__in=book_ids).restock(copies)
+
+
+def claim_holds(user_id, book_ids) -> list:
+    """Fulfils the user's ready holds of the books, returns the claimed book ids"""
+    holds = Hold.objects.ready().filter(user_id=user_id, book_id__in=book_ids)
+    claimed = dict(holds.select_for_update().values_list("id", "book_id"))
+    if claimed:
+        holds.filter(pk__in=list(claimed)).update(status=Hold.StatusChoices.FULFILLED)
+    return list(claimed.values())
+
+
+@transaction.atomic
+def cancel_hold(hold_id) -> bool:
+    """Cancels an open hold, a copy already set aside goes to the next one"""
+    hold = (
+        Hold.objects.select_for_update()
+        .filter(
+            pk=hold_id,
+            status__in=(Hold.StatusChoices.WAITING, Hold.StatusChoices.READY),
+        )
+        .first()
+    )
+    if hold is None:
+        return False
+
+    Hold.objects.filter(pk=hold.pk).update(status=Hold.StatusChoices.CANCELLED)
+    if hold.status == Hold.StatusChoices.READY:
+        release_copies(Counter([hold.book_id]))
+    return True
+
+
+@transaction.atomic
+def expire_batch(batch_size=EXPIRE_BATCH_SIZE, now=None) -> int:
+    """
+    Expires one batch of ready holds that were not picked up in time and
+    passes their copies on. Returns the number of holds expired.
+    """
+    expired = list(
+        Hold.objects.ready()
+        .filter(expires_at__lt=now or timezone.now())
+        .select_for_update(skip_locked=True)
+        .order_by("expires_at")
+        .values_list("id", "book_id")[:batch_size]
+    )
+    if not expired:
+        return 0
+
+    Hold.objects.filter(pk__in=[hold_id for hold_id, _ in expired]).update(
+        status=Hold.StatusChoices.EXPIRED
+    )
+    release_copies(Counter(book_id for _, book_id in expired))
+    return len(expired)
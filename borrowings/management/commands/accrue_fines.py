@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from borrowings.fines import accrue_fines
+
+
+class Command(BaseCommand):
+    help = (
+        "Opens fines for borrowings that became overdue since the last run "
+        "and updates the amounts of the open ones. Safe to run repeatedly"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rescan",
+            action="store_true",
+            help="Ignore the stored watermark and look at every due date",
+        )
+
+    def handle(self, *args, **options):
+        result = accrue_fines(rescan=options["rescan"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Finalized {result['finalized']} fines, "
+                f"{result['accruing']} fines still accruing"
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from borrowings.archive import ARCHIVE_BATCH_SIZE, archive_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves borrowings returned more than --days ago to the history table "
+        "in small batches, so the borrowings table only keeps recent loans"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        archived = 0
+        while True:
+            moved = archive_batch(options["days"], options["batch_size"])
+            if not moved:
+                break
+            archived += moved
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} borrowings"))
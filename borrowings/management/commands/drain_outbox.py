@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from borrowings.outbox import (
+    DRAIN_BATCH_SIZE,
+    drain_batch,
+    get_sinks,
+    requeue_dead_letters,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers borrowing events from the outbox to the sinks configured in "
+        "BORROWING_OUTBOX_SINKS, oldest first, in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DRAIN_BATCH_SIZE)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new events instead of exiting when drained",
+        )
+        parser.add_argument("--interval", type=float, default=1.0)
+        parser.add_argument(
+            "--requeue-dead-letters",
+            action="store_true",
+            help="Give events that used up their attempts a new set first",
+        )
+
+    def handle(self, *args, **options):
+        sinks = get_sinks()
+        if not sinks:
+            raise CommandError("No sinks configured in BORROWING_OUTBOX_SINKS")
+
+        if options["requeue_dead_letters"]:
+            requeued = requeue_dead_letters()
+            self.stdout.write(f"Requeued {requeued} dead letters")
+
+        delivered = failed = 0
+        while True:
+            try:
+                batch = drain_batch(sinks, options["batch_size"])
+            except Exception as error:
+                # The failed events wait for their retry, the rest go on
+                failed += 1
+                self.stderr.write(f"Delivery failed, will retry: {error!r}")
+                continue
+
+            delivered += batch
+            if batch:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        if failed:
+            raise CommandError(f"Delivered {delivered} events, {failed} batches failed")
+        self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} events"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from borrowings.holds import EXPIRE_BATCH_SIZE, expire_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Expires ready holds that were not picked up in time, in batches, "
+        "and hands their copies to the next hold or back to the shelf"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=EXPIRE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        expired = 0
+        while True:
+            batch = expire_batch(options["batch_size"])
+            if not batch:
+                break
+            expired += batch
+
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} holds"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from borrowings.counters import find_counter_drift, fix_counter_drift
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the active_loans counters of users and books with their "
+        "active borrowings and, with --fix, recounts the ones that drifted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = find_counter_drift()
+            for kind, rows in drift.items():
+                for pk, stored, actual in rows:
+                    self.stdout.write(f"{kind} {pk}: stored {stored}, actual {actual}")
+            if options["fix"]:
+                fix_counter_drift(drift)
+
+        drifted = len(drift["users"]) + len(drift["books"])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Loan counters are in sync"))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {drifted} loan counters"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{drifted} loan counters drifted"))
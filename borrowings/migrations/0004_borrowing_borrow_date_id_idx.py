@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrowings", "0003_rename_borrowings_borrowing"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["borrow_date", "id"], name="borrowings_borrow_date_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.4 on 2026-10-18 19:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("books", "0007_book_external_id"),
+        ("borrowings", "0006_fine_watermark"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="fine",
+            name="borrowing",
+            field=models.OneToOneField(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="fine",
+                to="borrowings.borrowing",
+            ),
+        ),
+        migrations.CreateModel(
+            name="BorrowingHistory",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("borrow_date", models.DateField()),
+                ("expected_return_date", models.DateField()),
+                ("actual_return_date", models.DateField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "borrowing history",
+                "indexes": [
+                    models.Index(
+                        fields=["borrow_date", "id"], name="borrowings_hist_date_id_idx"
+                    ),
+                    models.Index(
+                        fields=["user", "borrow_date"],
+                        name="borrowings_hist_user_date_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
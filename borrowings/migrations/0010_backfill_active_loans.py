@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from borrowings.counters import active_loans_subquery
+
+
+def backfill_active_loans(apps, schema_editor):
+    """Counts the borrowings that were already open when the counters were added"""
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    for model, field in (
+        (apps.get_model("users", "User"), "user"),
+        (apps.get_model("books", "Book"), "book"),
+    ):
+        model.objects.update(active_loans=active_loans_subquery(field, Borrowing))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0009_book_author_names"),
+        ("users", "0004_revoked_token"),
+        ("borrowings", "0009_outbox_event"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_active_loans, migrations.RunPython.noop),
+    ]
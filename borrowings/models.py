@@ -3,17 +3,60 @@ import datetime
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
 from books.models import Book
 from users.models import User
 
 
+class BorrowingQuerySet(models.QuerySet):
+    def close(self, return_date=None) -> int:
+        """
+        Sets the return date of the still active borrowings with a single
+        conditional UPDATE, returns the number of borrowings closed
+        """
+        return self.filter(actual_return_date__isnull=True).update(
+            actual_return_date=return_date or datetime.date.today()
+        )
+
+    def create_trusted(self, **kwargs):
+        """
+        Creates a borrowing from data that was already validated, e.g. by a
+        serializer, skipping full_clean() and its book/user lookups
+        """
+        borrowing = self.model(**kwargs)
+        borrowing.save(force_insert=True, using=self.db, validate=False)
+        return borrowing
+
+
 class Borrowing(models.Model):
     borrow_date = models.DateField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(null=True, blank=True)
     book: Book = models.ForeignKey(Book, on_delete=models.CASCADE)
-    user: User = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Covered by the (user, actual_return_date) index
+    user: User = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
+    )
+
+    objects = BorrowingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["borrow_date", "id"],
+                name="borrowings_borrow_date_id_idx",
+            ),
+            models.Index(
+                fields=["user", "actual_return_date"],
+                name="borrowings_user_returned_idx",
+            ),
+            models.Index(
+                fields=["expected_return_date"],
+                name="borrowings_active_due_idx",
+                condition=models.Q(actual_return_date__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         is_active_str = (
@@ -47,15 +90,6 @@ class Borrowing(models.Model):
                 }
             )
 
-    @staticmethod
-    def validate_book_inventory(book_inventory, error_to_raise):
-        if book_inventory == 0:
-            raise error_to_raise(
-                {
-                    "book": f"Borrowing cannot be created, because the inventory of the current book is 0"
-                }
-            )
-
     def clean(self):
         Borrowing.validate_date(
             self.expected_return_date,
@@ -69,8 +103,189 @@ class Borrowing(models.Model):
         force_update=False,
         using=None,
         update_fields=None,
+        validate=True,
     ):
-        self.full_clean()
+        if validate:
+            self.full_clean()
         return super(Borrowing, self).save(
             force_insert, force_update, using, update_fields
         )
+
+
+class BorrowingHistory(models.Model):
+    """Returned borrowings moved out of the hot table by archive_borrowings"""
+
+    id = models.BigIntegerField(primary_key=True)
+    borrow_date = models.DateField()
+    expected_return_date = models.DateField()
+    actual_return_date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+        db_index=False,
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "borrowing history"
+        indexes = [
+            models.Index(
+                fields=["borrow_date", "id"],
+                name="borrowings_hist_date_id_idx",
+            ),
+            models.Index(
+                fields=["user", "borrow_date"],
+                name="borrowings_hist_user_date_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Borrowing {self.id}; Return date: {self.actual_return_date}"
+
+
+class Fine(models.Model):
+    """Late fee of an overdue borrowing, kept up to date by accrue_fines"""
+
+    # No constraint, fines stay when their borrowing moves to the history table
+    borrowing = models.OneToOneField(
+        Borrowing,
+        on_delete=models.DO_NOTHING,
+        related_name="fine",
+        db_constraint=False,
+    )
+    due_date = models.DateField()
+    daily_fee = models.DecimalField(max_digits=5, decimal_places=2)
+    days_overdue = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    is_final = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["borrowing"],
+                name="borrowings_fine_open_idx",
+                condition=models.Q(is_final=False),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Fine for borrowing {self.borrowing_id}: {self.amount}"
+
+
+class Watermark(models.Model):
+    """The date up to which an incremental job has processed its rows"""
+
+    name = models.CharField(max_length=64, unique=True)
+    value = models.DateField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class HoldQuerySet(models.QuerySet):
+    def waiting(self):
+        return self.filter(status=Hold.StatusChoices.WAITING)
+
+    def ready(self):
+        return self.filter(status=Hold.StatusChoices.READY)
+
+    def pop(self, book_id, copies: int = 1) -> int:
+        """
+        Makes the first `copies` waiting holds of the book ready for pickup.
+        The queue head is read from the partial (book, id) index, locked rows
+        are skipped so concurrent returns take different holds.
+        """
+        hold_ids = list(
+            self.waiting()
+            .filter(book_id=book_id)
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", flat=True)[:copies]
+        )
+        if not hold_ids:
+            return 0
+
+        now = timezone.now()
+        pickup_days = getattr(settings, "HOLD_PICKUP_DAYS", 3)
+        return (
+            self.waiting()
+            .filter(pk__in=hold_ids)
+            .update(
+                status=Hold.StatusChoices.READY,
+                ready_at=now,
+                expires_at=now + datetime.timedelta(days=pickup_days),
+            )
+        )
+
+
+class Hold(models.Model):
+    """A place in the FIFO queue of an out of stock book"""
+
+    class StatusChoices(models.TextChoices):
+        WAITING = "WAITING"
+        READY = "READY"
+        FULFILLED = "FULFILLED"
+        CANCELLED = "CANCELLED"
+        EXPIRED = "EXPIRED"
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="holds")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="holds"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=StatusChoices.choices,
+        default=StatusChoices.WAITING,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = HoldQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["book", "id"],
+                name="borrowings_hold_queue_idx",
+                condition=models.Q(status="WAITING"),
+            ),
+            models.Index(
+                fields=["expires_at"],
+                name="borrowings_hold_ready_idx",
+                condition=models.Q(status="READY"),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "user"],
+                condition=models.Q(status__in=["WAITING", "READY"]),
+                name="borrowings_hold_one_open_per_user",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Hold of {self.book_id} for {self.user_id}: {self.status}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A borrowing event written in the same transaction as the change itself,
+    delivered to the configured sinks and deleted by drain_outbox
+    """
+
+    event_type = models.CharField(max_length=64)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    # Set after a failed delivery, the event is not retried before then
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # Set once the event used up its attempts, drain_outbox skips it from then on
+    dead_lettered_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event_type} #{self.id}"
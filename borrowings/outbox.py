@@ -0,0 +1,160 @@
+import abc
+import datetime
+import json
+import queue
+from collections import defaultdict
+from itertools import takewhile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from borrowings.models import OutboxEvent
+
+BORROWING_CREATED = "borrowing.created"
+BORROWING_RETURNED = "borrowing.returned"
+DRAIN_BATCH_SIZE = 100
+MAX_ATTEMPTS = 10
+RETRY_DELAY = 30
+
+
+def record(event_type: str, payloads) -> None:
+    """Adds events to the outbox of the current transaction with one INSERT"""
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(event_type=event_type, payload=payload) for payload in payloads]
+    )
+
+
+def borrowing_payload(borrowing) -> dict:
+    return {
+        "borrowing_id": borrowing.id,
+        "book_id": borrowing.book_id,
+        "user_id": borrowing.user_id,
+        "expected_return_date": borrowing.expected_return_date.isoformat(),
+    }
+
+
+def serialize_event(event) -> dict:
+    """The message sinks get, `id` lets consumers drop redelivered events"""
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "created_at": event.created_at.isoformat(),
+        "payload": event.payload,
+    }
+
+
+class Sink(abc.ABC):
+    """Delivers a batch of events, raising if any of them was not delivered"""
+
+    @abc.abstractmethod
+    def deliver(self, events: list) -> None:
+        ...
+
+
+class FileSink(Sink):
+    """Appends events to a file as NDJSON"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def deliver(self, events: list) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            for event in events:
+                file.write(json.dumps(event) + "\n")
+
+
+LOCAL_QUEUE = queue.Queue()
+
+
+class LocalQueueSink(Sink):
+    """Puts events on an in-process queue, meant for tests and development"""
+
+    def __init__(self, target=None):
+        self.queue = LOCAL_QUEUE if target is None else target
+
+    def deliver(self, events: list) -> None:
+        for event in events:
+            self.queue.put(event)
+
+
+def get_sinks() -> list:
+    """Builds the sinks from BORROWING_OUTBOX_SINKS, (dotted path, kwargs) pairs"""
+    return [
+        import_string(path)(**options)
+        for path, options in getattr(settings, "BORROWING_OUTBOX_SINKS", ())
+    ]
+
+
+def pending_events(now=None):
+    """Events that are due, retries wait out their delay, dead letters never come back"""
+    now = now or timezone.now()
+    return OutboxEvent.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        dead_lettered_at__isnull=True,
+    )
+
+
+def _record_failure(events, error, now) -> None:
+    """
+    Delays the next attempt of each event, doubling the delay every time.
+    Events that used up BORROWING_OUTBOX_MAX_ATTEMPTS become dead letters.
+    """
+    max_attempts = getattr(settings, "BORROWING_OUTBOX_MAX_ATTEMPTS", MAX_ATTEMPTS)
+    delay = getattr(settings, "BORROWING_OUTBOX_RETRY_DELAY", RETRY_DELAY)
+    by_attempts = defaultdict(list)
+    for event in events:
+        by_attempts[event.attempts + 1].append(event.id)
+
+    for attempts, event_ids in by_attempts.items():
+        if attempts >= max_attempts:
+            state = {"dead_lettered_at": now}
+        else:
+            retry_in = datetime.timedelta(seconds=delay * 2 ** (attempts - 1))
+            state = {"next_attempt_at": now + retry_in}
+        OutboxEvent.objects.filter(pk__in=event_ids).update(
+            attempts=attempts, last_error=repr(error), **state
+        )
+
+
+def drain_batch(sinks, batch_size=DRAIN_BATCH_SIZE, now=None) -> int:
+    """
+    Delivers the oldest batch of due events to every sink and deletes it.
+    Events are deleted only after all sinks accepted them, so a crash or a
+    failing sink means the batch is delivered again (at-least-once).
+    A failed event is retried on its own after a delay, so an event no sink
+    accepts cannot hold back the ones behind it, and becomes a dead letter
+    after BORROWING_OUTBOX_MAX_ATTEMPTS. Returns the number of events delivered.
+    """
+    now = now or timezone.now()
+    events = []
+    try:
+        with transaction.atomic():
+            pending = pending_events(now).select_for_update(skip_locked=True)
+            events = list(pending.order_by("id")[:batch_size])
+            if not events:
+                return 0
+            # Retries go one by one, fresh events in a batch up to the first retry
+            if events[0].attempts:
+                events = events[:1]
+            else:
+                events = list(takewhile(lambda event: not event.attempts, events))
+
+            messages = [serialize_event(event) for event in events]
+            for sink in sinks:
+                sink.deliver(messages)
+            OutboxEvent.objects.filter(pk__in=[event.id for event in events]).delete()
+    except Exception as error:
+        if events:
+            _record_failure(events, error, now)
+        raise
+    return len(events)
+
+
+def requeue_dead_letters() -> int:
+    """Gives dead letters a fresh set of attempts, returns how many were requeued"""
+    return OutboxEvent.objects.filter(dead_lettered_at__isnull=False).update(
+        dead_lettered_at=None, next_attempt_at=None, attempts=0
+    )
@@ -1,6 +1,44 @@
 from rest_framework.pagination import PageNumberPagination
 
+from books.paginations import KeysetPagination
+
 
 class BorrowingPagination(PageNumberPagination):
     page_size = 5
     max_page_size = 1000
+
+
+class BorrowingBalancePagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class BorrowingCursorPagination(KeysetPagination):
+    page_size = 5
+    max_page_size = 1000
+    ordering = ("-borrow_date", "-id")
+    count_cache_timeout = 60
+
+
+class BorrowingHistoryCursorPagination(BorrowingCursorPagination):
+    """
+    Keyset pages over returned borrowings and their archive. A UNION can't
+    be filtered, so it is paginated from its parts, querysets of rows as
+    dicts: the keyset condition goes into each of them, their union is
+    ordered and cut to a page.
+    """
+
+    def filter_page(self, queryset, ordering, key):
+        filter_part = super().filter_page
+        first, *others = [
+            filter_part(part, ordering, key).order_by() for part in queryset
+        ]
+        return first.union(*others, all=True).order_by(*ordering)
+
+    def get_cached_count(self, queryset):
+        first, *others = queryset
+        return super().get_cached_count(first.union(*others, all=True))
+
+    def _get_key(self, row):
+        return [row[field.lstrip("-")] for field in self.ordering]
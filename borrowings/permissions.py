@@ -16,7 +16,7 @@ class IsAdminOrIfIsOwnerGetPost(BasePermission):
         return bool(
             (request.user and request.user.is_staff)
             or (
-                    (obj.user == request.user)
+                    (obj.user_id == request.user.id)
                     and (request.method in SAFE_METHODS + ("POST",))
             )
         )
@@ -0,0 +1,148 @@
+import datetime
+from collections import Counter, defaultdict, deque
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from books.models import Book
+from borrowings import outbox
+from borrowings.counters import group_by_amount, release_loans
+from borrowings.holds import allocate_copies
+from borrowings.models import Borrowing
+
+RETURNED = "returned"
+NOT_FOUND = "not_found"
+ALREADY_RETURNED = "already_returned"
+NO_ACTIVE_BORROWING = "no_active_borrowing"
+
+
+def restock_books(returned_copies: Counter) -> None:
+    """
+    Ends the loans of returned copies. Copies go to the heads of the hold
+    queues first and to the shelf after, with one UPDATE per distinct
+    (copies, held) pair.
+    """
+    held = allocate_copies(returned_copies)
+    amounts = {
+        book_id: (copies, held[book_id]) for book_id, copies in returned_copies.items()
+    }
+    for (copies, held_copies), book_ids in group_by_amount(amounts).items():
+        Book.objects.filter(pk__in=book_ids).return_copies(copies, held=held_copies)
+
+
+def finish_returns(returned, return_date) -> None:
+    """
+    Everything that follows closing borrowings, in the same transaction:
+    copies go to holds or the shelf, loan counters go down and a
+    borrowing.returned event is written to the outbox
+    """
+    restock_books(Counter(item["book_id"] for item in returned))
+    release_loans(Counter(item["user_id"] for item in returned))
+    outbox.record(
+        outbox.BORROWING_RETURNED,
+        [
+            {
+                "borrowing_id": item["borrowing_id"],
+                "book_id": item["book_id"],
+                "user_id": item["user_id"],
+                "actual_return_date": return_date.isoformat(),
+            }
+            for item in returned
+        ],
+    )
+
+
+def _results_by_borrowing_ids(borrowing_ids):
+    borrowings = {
+        borrowing_id: (book_id, user_id, actual_return_date)
+        for borrowing_id, book_id, user_id, actual_return_date in Borrowing.objects.filter(
+            pk__in=borrowing_ids
+        )
+        .select_for_update()
+        .values_list("id", "book_id", "user_id", "actual_return_date")
+    }
+
+    results = []
+    closing = set()
+    for borrowing_id in borrowing_ids:
+        if borrowing_id not in borrowings:
+            results.append(
+                {"borrowing_id": borrowing_id, "book_id": None, "status": NOT_FOUND}
+            )
+            continue
+
+        book_id, user_id, actual_return_date = borrowings[borrowing_id]
+        if actual_return_date is not None or borrowing_id in closing:
+            result_status = ALREADY_RETURNED
+        else:
+            result_status = RETURNED
+            closing.add(borrowing_id)
+        results.append(
+            {
+                "borrowing_id": borrowing_id,
+                "book_id": book_id,
+                "user_id": user_id,
+                "status": result_status,
+            }
+        )
+    return results
+
+
+def _results_by_book_ids(book_ids):
+    """Every scanned copy closes the oldest active borrowing of its book"""
+    active = defaultdict(deque)
+    borrowings = (
+        Borrowing.objects.filter(
+            book_id__in=set(book_ids), actual_return_date__isnull=True
+        )
+        .select_for_update()
+        .order_by("borrow_date", "id")
+        .values_list("id", "book_id", "user_id")
+    )
+    for borrowing_id, book_id, user_id in borrowings:
+        active[book_id].append((borrowing_id, user_id))
+
+    results = []
+    for book_id in book_ids:
+        if active[book_id]:
+            (borrowing_id, user_id), result_status = active[book_id].popleft(), RETURNED
+        else:
+            borrowing_id, user_id, result_status = None, None, NO_ACTIVE_BORROWING
+        results.append(
+            {
+                "borrowing_id": borrowing_id,
+                "book_id": book_id,
+                "user_id": user_id,
+                "status": result_status,
+            }
+        )
+    return results
+
+
+@transaction.atomic
+def return_borrowings(borrowing_ids=None, book_ids=None, return_date=None) -> list:
+    """
+    Closes many borrowings at once, picked by id or by scanned book, with
+    one set-based UPDATE and grouped inventory increments.
+    Returns a result per requested item, in the order they were given.
+    """
+    if borrowing_ids:
+        results = _results_by_borrowing_ids(borrowing_ids)
+    else:
+        results = _results_by_book_ids(book_ids)
+
+    returned = [result for result in results if result["status"] == RETURNED]
+    if not returned:
+        return results
+
+    return_date = return_date or datetime.date.today()
+    closed = Borrowing.objects.filter(
+        pk__in=[result["borrowing_id"] for result in returned]
+    ).close(return_date)
+    if closed != len(returned):
+        raise ValidationError(
+            "Some of the borrowings were returned concurrently, retry the request"
+        )
+
+    finish_returns(returned, return_date)
+    return results
@@ -1,9 +1,19 @@
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from books.models import Book
-from books.serializers import BookDetailSerializer, BookListSerializer
-from borrowings.models import Borrowing
+from books.serializers import (
+    BookDetailSerializer,
+    BookListSerializer,
+    FragmentListSerializer,
+)
+from borrowings import outbox
+from borrowings.counters import take_loans
+from borrowings.holds import claim_holds
+from borrowings.models import Borrowing, Hold
+
+TOO_MANY_LOANS_MESSAGE = "You have reached the maximum number of active borrowings"
 
 
 class BorrowingSerializer(serializers.ModelSerializer):
@@ -16,10 +26,6 @@ class BorrowingSerializer(serializers.ModelSerializer):
             ValidationError,
             attrs.get("actual_return_date", None),
         )
-        Borrowing.validate_book_inventory(
-            attrs["book"].inventory,
-            ValidationError,
-        )
         return data
 
     class Meta:
@@ -33,6 +39,7 @@ class BorrowingSerializer(serializers.ModelSerializer):
             "user",
             "is_active",
         )
+        list_serializer_class = FragmentListSerializer
 
 
 class BorrowingListSerializer(BorrowingSerializer):
@@ -52,13 +59,106 @@ class BorrowingCreateSerializer(BorrowingSerializer):
             "book",
         )
 
+    @transaction.atomic
     def create(self, validated_data):
-        borrowing = Borrowing.objects.create(**validated_data)
-        borrowing.book.inventory -= 1
-        borrowing.book.save()
+        book = validated_data["book"]
+        if not take_loans(validated_data["user_id"]):
+            raise ValidationError({"user": TOO_MANY_LOANS_MESSAGE})
+        # A copy set aside for the user's ready hold goes first, taking one
+        # off the shelf instead would leave the reserved copy locked away
+        if claim_holds(validated_data["user_id"], [book.pk]):
+            Book.objects.filter(pk=book.pk).lend_held()
+        elif Book.objects.filter(pk=book.pk).lend():
+            book.inventory -= 1
+        else:
+            raise ValidationError(
+                {
+                    "book": "Borrowing cannot be created, because the current book is out of stock"
+                }
+            )
+        borrowing = Borrowing.objects.create_trusted(**validated_data)
+        outbox.record(outbox.BORROWING_CREATED, [outbox.borrowing_payload(borrowing)])
         return borrowing
 
 
+class BorrowingCheckoutSerializer(serializers.Serializer):
+    books = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=20,
+    )
+    expected_return_date = serializers.DateField()
+
+    def validate_books(self, value):
+        if len(set(value)) != len(value):
+            raise ValidationError("Each book can only be checked out once.")
+
+        inventory = dict(
+            Book.objects.filter(pk__in=value).values_list("id", "inventory")
+        )
+        missing = [book_id for book_id in value if book_id not in inventory]
+        if missing:
+            raise ValidationError(f"Books not found: {missing}")
+
+        self.held_books = []
+        request = self.context.get("request")
+        if request is not None:
+            # Copies set aside for the user's ready holds are lent before
+            # shelf copies, they are not counted in the inventory
+            self.held_books = list(
+                Hold.objects.ready()
+                .filter(user_id=request.user.id, book_id__in=value)
+                .values_list("book_id", flat=True)
+            )
+        out_of_stock = [
+            book_id
+            for book_id in value
+            if inventory[book_id] < 1 and book_id not in self.held_books
+        ]
+        if out_of_stock:
+            raise ValidationError(f"Books out of stock: {out_of_stock}")
+        return value
+
+    def validate_expected_return_date(self, value):
+        Borrowing.validate_date(value, ValidationError)
+        return value
+
+    @transaction.atomic
+    def create(self, validated_data):
+        book_ids = validated_data["books"]
+        user_id = validated_data["user_id"]
+        if not take_loans(user_id, len(book_ids)):
+            raise ValidationError({"user": TOO_MANY_LOANS_MESSAGE})
+
+        held_books = getattr(self, "held_books", [])
+        shelf_books = [book_id for book_id in book_ids if book_id not in held_books]
+        lent = Book.objects.filter(pk__in=shelf_books).lend() if shelf_books else 0
+        claimed = claim_holds(user_id, held_books) if held_books else []
+        if lent != len(shelf_books) or len(claimed) != len(held_books):
+            # Someone took the last copy after validation, the whole cart rolls back
+            raise ValidationError(
+                {"books": "Some of the books went out of stock, please try again"}
+            )
+        if claimed:
+            Book.objects.filter(pk__in=claimed).lend_held()
+
+        borrowings = Borrowing.objects.bulk_create(
+            [
+                Borrowing(
+                    book_id=book_id,
+                    user_id=validated_data["user_id"],
+                    expected_return_date=validated_data["expected_return_date"],
+                )
+                for book_id in book_ids
+            ]
+        )
+        outbox.record(
+            outbox.BORROWING_CREATED,
+            [outbox.borrowing_payload(borrowing) for borrowing in borrowings],
+        )
+        return borrowings
+
+
 class BorrowingReturnSerializer(BorrowingSerializer):
     actual_return_date = serializers.DateField(required=False, read_only=True)
 
@@ -79,3 +179,70 @@ class BorrowingReturnSerializer(BorrowingSerializer):
             "book",
             "user",
         )
+
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    borrowing_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=1000,
+    )
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=1000,
+    )
+
+    def validate(self, attrs):
+        if ("borrowing_ids" in attrs) == ("book_ids" in attrs):
+            raise ValidationError("Provide either borrowing_ids or book_ids.")
+        return attrs
+
+
+class BorrowingBulkReturnResultSerializer(serializers.Serializer):
+    borrowing_id = serializers.IntegerField(allow_null=True)
+    book_id = serializers.IntegerField(allow_null=True)
+    status = serializers.CharField()
+
+
+class BorrowingBalanceSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    email = serializers.EmailField()
+    active_loans = serializers.IntegerField()
+    overdue_loans = serializers.IntegerField()
+    outstanding_fees = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class HoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Hold
+        fields = (
+            "id",
+            "book",
+            "user",
+            "status",
+            "created_at",
+            "ready_at",
+            "expires_at",
+        )
+        read_only_fields = (
+            "user",
+            "status",
+            "created_at",
+            "ready_at",
+            "expires_at",
+        )
+
+    def validate_book(self, book):
+        if book.inventory > 0:
+            raise ValidationError("This book is available, borrow it instead.")
+
+        request = self.context["request"]
+        open_statuses = (Hold.StatusChoices.WAITING, Hold.StatusChoices.READY)
+        if Hold.objects.filter(
+            book=book, user_id=request.user.id, status__in=open_statuses
+        ).exists():
+            raise ValidationError("You already have a hold on this book.")
+        return book
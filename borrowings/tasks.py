@@ -0,0 +1,29 @@
+from borrowings.archive import archive_batch
+from borrowings.fines import accrue_fines
+from borrowings.holds import expire_batch
+from borrowings.outbox import drain_batch, get_sinks
+from jobs.registry import task
+
+
+@task("borrowings.accrue_fines")
+def accrue_fines_task(rescan=False):
+    accrue_fines(rescan=rescan)
+
+
+@task("borrowings.expire_holds")
+def expire_holds_task():
+    while expire_batch():
+        pass
+
+
+@task("borrowings.archive")
+def archive_task(days=365):
+    while archive_batch(days):
+        pass
+
+
+@task("borrowings.drain_outbox", max_attempts=5)
+def drain_outbox_task():
+    sinks = get_sinks()
+    while sinks and drain_batch(sinks):
+        pass
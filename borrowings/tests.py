@@ -1,17 +1,58 @@
 import datetime
+import json
+import queue
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from importlib import import_module
+from unittest import mock, skipUnless
 
+from django.apps import apps
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 
 from rest_framework.test import APIClient
 
+from books.cache import bump_catalog_version
 from books.models import Book
-from borrowings.models import Borrowing
-from borrowings.serializers import BorrowingListSerializer, BorrowingDetailSerializer
+from borrowings.archive import archive_batch
+from borrowings.counters import release_loans
+from borrowings.fines import accrue_fines, user_balances
+from borrowings.returns import return_borrowings
+from borrowings.holds import expire_batch
+from borrowings import outbox
+from borrowings.models import (
+    Borrowing,
+    BorrowingHistory,
+    Fine,
+    Hold,
+    OutboxEvent,
+    Watermark,
+)
+from borrowings.serializers import (
+    BorrowingCheckoutSerializer,
+    BorrowingCreateSerializer,
+    BorrowingDetailSerializer,
+    BorrowingListSerializer,
+)
 
 BORROWINGS_URL = reverse("borrowings:borrowings-list")
+BULK_RETURN_URL = reverse("borrowings:borrowings-bulk-return")
+CHECKOUT_URL = reverse("borrowings:borrowings-checkout")
+BALANCES_URL = reverse("borrowings:borrowings-balances")
+HOLDS_URL = reverse("borrowings:holds-list")
 EXPECTED_RETURN_DATE = datetime.date.today() + datetime.timedelta(days=3)
 
 
@@ -37,7 +78,18 @@ def sample_borrowing(user, **params):
     }
     defaults.update(params)
 
-    return Borrowing.objects.create(**defaults)
+    borrowing = Borrowing.objects.create(**defaults)
+    if borrowing.actual_return_date is None:
+        # Count the loan the way a checkout would, returns release it again
+        Book.objects.filter(pk=borrowing.book_id).update(
+            active_loans=F("active_loans") + 1
+        )
+        get_user_model().objects.filter(pk=borrowing.user_id).update(
+            active_loans=F("active_loans") + 1
+        )
+        borrowing.book.active_loans += 1
+        borrowing.user.active_loans += 1
+    return borrowing
 
 
 def borrowing_detail_url(borrowings_id):
@@ -50,6 +102,7 @@ def borrowing_return_url(borrowings_id):
 
 class UnauthenticatedBorrowingApiTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
 
     def test_auth_required(self):
@@ -59,6 +112,7 @@ class UnauthenticatedBorrowingApiTests(TestCase):
 
 class AuthenticatedBorrowingApiTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.other_user = get_user_model().objects.create_user(
             "other@test.com",
@@ -177,9 +231,38 @@ class AuthenticatedBorrowingApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_return_borrowing_uses_conditional_updates(self):
+        borrowing = sample_borrowing(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(borrowing_return_url(borrowing.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 3)
+        self.assertIn('"actual_return_date" IS NULL', updates[0])
+        self.assertNotIn('"title"', updates[1])
+        self.assertIn('"active_loans"', updates[2])
+
+    def test_return_closed_elsewhere_does_not_add_inventory(self):
+        book = sample_book(inventory=0)
+        borrowing = sample_borrowing(book=book, user=self.user)
+        Borrowing.objects.filter(pk=borrowing.pk).close()
+
+        res = self.client.post(borrowing_return_url(borrowing.id))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 0)
+
 
 class AdminBorrowingApiTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.other_user = get_user_model().objects.create_user(
             "other@test.com",
@@ -218,3 +301,1275 @@ class AdminBorrowingApiTests(TestCase):
         self.assertIn(serializer1.data, res.data["results"])
         self.assertIn(serializer2.data, res.data["results"])
         self.assertNotIn(serializer3.data, res.data["results"])
+
+    def test_list_borrowings_with_cursor_pagination(self):
+        borrowings = [sample_borrowing(user=self.other_user) for _ in range(12)]
+        Borrowing.objects.filter(id=borrowings[0].id).update(
+            borrow_date=datetime.date.today() + datetime.timedelta(days=1)
+        )
+        Borrowing.objects.filter(id=borrowings[1].id).update(
+            borrow_date=datetime.date.today() - datetime.timedelta(days=1)
+        )
+
+        res = self.client.get(BORROWINGS_URL, {"pagination": "cursor"})
+        self.assertNotIn("count", res.data)
+
+        ids = []
+        while True:
+            ids.extend(borrowing["id"] for borrowing in res.data["results"])
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+
+        expected = (
+            [borrowings[0].id]
+            + [borrowing.id for borrowing in reversed(borrowings[2:])]
+            + [borrowings[1].id]
+        )
+        self.assertEqual(ids, expected)
+
+    def test_cursor_pagination_with_cached_count(self):
+        cache.clear()
+        sample_borrowing(user=self.user)
+        sample_borrowing(user=self.user)
+
+        params = {"pagination": "cursor", "with_count": "true"}
+        res = self.client.get(BORROWINGS_URL, params)
+        self.assertEqual(res.data["count"], 2)
+
+        sample_borrowing(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BORROWINGS_URL, params)
+
+        self.assertEqual(res.data["count"], 2)
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"])
+
+
+class BulkReturnApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.user = get_user_model().objects.create_user("user@test.com", "testpass")
+        self.client.force_authenticate(self.admin)
+
+    def test_bulk_return_only_for_admin(self):
+        self.client.force_authenticate(self.user)
+        res = self.client.post(BULK_RETURN_URL, {"borrowing_ids": [1]}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_return_requires_exactly_one_kind_of_ids(self):
+        for payload in ({}, {"borrowing_ids": [1], "book_ids": [1]}):
+            res = self.client.post(BULK_RETURN_URL, payload, format="json")
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_return_by_borrowing_ids(self):
+        book = sample_book(inventory=0)
+        first = sample_borrowing(self.user, book=book)
+        second = sample_borrowing(self.user, book=book)
+        other = sample_borrowing(self.user)
+        closed = sample_borrowing(self.user, actual_return_date=datetime.date.today())
+
+        ids = [first.id, second.id, other.id, closed.id, 999, first.id]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                BULK_RETURN_URL, {"borrowing_ids": ids}, format="json"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item["borrowing_id"], item["status"]) for item in res.data],
+            [
+                (first.id, "returned"),
+                (second.id, "returned"),
+                (other.id, "returned"),
+                (closed.id, "already_returned"),
+                (999, "not_found"),
+                (first.id, "already_returned"),
+            ],
+        )
+        self.assertEqual(
+            Borrowing.objects.filter(actual_return_date__isnull=True).count(), 0
+        )
+        book.refresh_from_db()
+        other.book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+        self.assertEqual(other.book.inventory, 3)
+
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        # close, inventory of both books (1 and 2 copies), user counter
+        self.assertEqual(len(updates), 4)
+
+    def test_bulk_return_by_scanned_books_closes_oldest_first(self):
+        book = sample_book(inventory=0)
+        borrowings = [sample_borrowing(self.user, book=book) for _ in range(3)]
+        Borrowing.objects.filter(id=borrowings[2].id).update(
+            borrow_date=datetime.date.today() - datetime.timedelta(days=5)
+        )
+
+        res = self.client.post(
+            BULK_RETURN_URL, {"book_ids": [book.id, book.id, 999]}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item["borrowing_id"], item["status"]) for item in res.data],
+            [
+                (borrowings[2].id, "returned"),
+                (borrowings[0].id, "returned"),
+                (None, "no_active_borrowing"),
+            ],
+        )
+        borrowings[1].refresh_from_db()
+        self.assertIsNone(borrowings[1].actual_return_date)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 2)
+
+
+class CheckoutApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user("user@test.com", "testpass")
+        self.client.force_authenticate(self.user)
+
+    def test_checkout_several_books(self):
+        books = [sample_book(inventory=1) for _ in range(5)]
+        payload = {
+            "books": [book.id for book in books],
+            "expected_return_date": EXPECTED_RETURN_DATE,
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(CHECKOUT_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item["book"] for item in res.data], payload["books"])
+        self.assertTrue(all(item["id"] for item in res.data))
+        self.assertEqual(
+            Borrowing.objects.filter(
+                user=self.user, expected_return_date=EXPECTED_RETURN_DATE
+            ).count(),
+            5,
+        )
+        self.assertFalse(Book.objects.exclude(inventory=0).exists())
+
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(("SELECT", "INSERT", "UPDATE"))
+            and "django_session" not in query["sql"]
+        ]
+        # stock check, ready holds lookup, user and book counter UPDATEs,
+        # borrowings and events INSERTs
+        self.assertEqual(len(statements), 6)
+
+    def test_checkout_is_all_or_nothing(self):
+        in_stock = sample_book(inventory=1)
+        out_of_stock = sample_book(inventory=0)
+        payload = {
+            "books": [in_stock.id, out_of_stock.id],
+            "expected_return_date": EXPECTED_RETURN_DATE,
+        }
+
+        res = self.client.post(CHECKOUT_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(out_of_stock.id), str(res.data["books"]))
+        self.assertFalse(Borrowing.objects.exists())
+        in_stock.refresh_from_db()
+        self.assertEqual(in_stock.inventory, 1)
+
+    def test_checkout_rolls_back_when_stock_runs_out_after_validation(self):
+        first = sample_book(inventory=1)
+        second = sample_book(inventory=1)
+        serializer = BorrowingCheckoutSerializer(
+            data={
+                "books": [first.id, second.id],
+                "expected_return_date": EXPECTED_RETURN_DATE,
+            }
+        )
+        self.assertTrue(serializer.is_valid())
+        Book.objects.filter(pk=second.pk).lend()
+
+        with self.assertRaises(ValidationError):
+            serializer.save(user_id=self.user.id)
+
+        first.refresh_from_db()
+        self.assertEqual(first.inventory, 1)
+        self.assertFalse(Borrowing.objects.exists())
+
+    def test_checkout_rejects_duplicate_and_unknown_books(self):
+        book = sample_book()
+        for books in ([book.id, book.id], [book.id, 999]):
+            res = self.client.post(
+                CHECKOUT_URL,
+                {"books": books, "expected_return_date": EXPECTED_RETURN_DATE},
+                format="json",
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Borrowing.objects.exists())
+
+
+class BorrowingQueryBudgetTests(TestCase):
+    """
+    Fixed number of queries per request for the borrowing endpoints,
+    no matter how many borrowings, books or authors are involved
+    """
+
+    LIST_BUDGET = 2  # count, page joined with books
+    DETAIL_BUDGET = 2  # borrowing joined with book, authors
+    # book lookup, user counter UPDATE, ready hold lookup, book counter
+    # UPDATE, borrowing and event INSERTs
+    CREATE_BUDGET = 6
+    # borrowing lookup, close, hold queue head, book and user counter UPDATEs,
+    # event INSERT
+    RETURN_BUDGET = 6
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.borrowings = []
+        for index in range(5):
+            book = sample_book(title=f"Book {index}")
+            for author_index in range(2):
+                book.authors.create(
+                    first_name=f"First {author_index}", last_name=f"Last {index}"
+                )
+            self.borrowings.append(sample_borrowing(self.user, book=book))
+
+    def assertWithinBudget(self, budget, request):
+        with CaptureQueriesContext(connection) as queries:
+            res = request()
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        self.assertLessEqual(len(statements), budget, "\n".join(statements))
+        return res
+
+    def test_list_budget(self):
+        res = self.assertWithinBudget(
+            self.LIST_BUDGET, lambda: self.client.get(BORROWINGS_URL)
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 5)
+
+    def test_list_budget_for_admin_filters(self):
+        self.user.is_staff = True
+        self.user.save()
+        res = self.assertWithinBudget(
+            self.LIST_BUDGET,
+            lambda: self.client.get(
+                BORROWINGS_URL, {"user_id": self.user.id, "is_active": "true"}
+            ),
+        )
+        self.assertEqual(len(res.data["results"]), 5)
+
+    def test_detail_budget(self):
+        res = self.assertWithinBudget(
+            self.DETAIL_BUDGET,
+            lambda: self.client.get(borrowing_detail_url(self.borrowings[0].id)),
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["book"]["authors"]), 2)
+
+    def test_create_budget(self):
+        book = sample_book()
+        payload = {"expected_return_date": EXPECTED_RETURN_DATE, "book": book.id}
+
+        res = self.assertWithinBudget(
+            self.CREATE_BUDGET, lambda: self.client.post(BORROWINGS_URL, payload)
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_return_budget(self):
+        url = borrowing_return_url(self.borrowings[0].id)
+
+        res = self.assertWithinBudget(self.RETURN_BUDGET, lambda: self.client.post(url))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@skipUnless(connection.vendor == "sqlite", "Plans are checked for SQLite")
+class BorrowingIndexPlanTests(TestCase):
+    """The hot borrowing filters are served by their indexes"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan)
+
+    def test_active_and_returned_borrowings_of_user(self):
+        active = Borrowing.objects.filter(user_id=1, actual_return_date__isnull=True)
+        returned = Borrowing.objects.filter(user_id=1, actual_return_date__isnull=False)
+
+        self.assertUsesIndex(active, "borrowings_user_returned_idx")
+        self.assertUsesIndex(returned, "borrowings_user_returned_idx")
+
+    def test_overdue_scan_uses_partial_index(self):
+        overdue = Borrowing.objects.filter(
+            actual_return_date__isnull=True,
+            expected_return_date__lt=datetime.date.today(),
+        )
+
+        self.assertUsesIndex(overdue, "borrowings_active_due_idx")
+
+
+class FineAccrualTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.today = datetime.date.today()
+
+    def overdue_borrowing(self, due_days_ago, returned_days_ago=None, **params):
+        borrowing = sample_borrowing(self.user, **params)
+        returned = (
+            None
+            if returned_days_ago is None
+            else self.today - datetime.timedelta(days=returned_days_ago)
+        )
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            expected_return_date=self.today - datetime.timedelta(days=due_days_ago),
+            actual_return_date=returned,
+        )
+        return borrowing
+
+    def fines(self):
+        return {
+            fine.borrowing_id: (fine.days_overdue, str(fine.amount), fine.is_final)
+            for fine in Fine.objects.all()
+        }
+
+    def test_fines_are_days_late_times_daily_fee(self):
+        active = self.overdue_borrowing(3)
+        returned_late = self.overdue_borrowing(5, returned_days_ago=2)
+        self.overdue_borrowing(5, returned_days_ago=6)
+        self.overdue_borrowing(0)
+
+        accrue_fines(self.today)
+
+        self.assertEqual(
+            self.fines(),
+            {
+                active.id: (3, "1.50", False),
+                returned_late.id: (3, "1.50", True),
+            },
+        )
+
+    def test_rerun_is_idempotent_and_later_runs_accrue(self):
+        active = self.overdue_borrowing(3)
+        due_today = self.overdue_borrowing(0)
+        accrue_fines(self.today)
+        before = self.fines()
+
+        accrue_fines(self.today)
+        self.assertEqual(self.fines(), before)
+
+        accrue_fines(self.today + datetime.timedelta(days=1))
+        self.assertEqual(
+            self.fines(),
+            {active.id: (4, "2.00", False), due_today.id: (1, "0.50", False)},
+        )
+
+    def test_return_finalizes_the_fine(self):
+        borrowing = self.overdue_borrowing(3)
+        accrue_fines(self.today)
+
+        Borrowing.objects.filter(pk=borrowing.pk).close(self.today)
+        accrue_fines(self.today + datetime.timedelta(days=2))
+
+        self.assertEqual(self.fines(), {borrowing.id: (3, "1.50", True)})
+
+    def test_only_due_dates_after_the_watermark_are_scanned(self):
+        accrue_fines(self.today)
+        self.assertEqual(Watermark.objects.get().value, self.today)
+        missed = self.overdue_borrowing(10)
+
+        call_command("accrue_fines", stdout=StringIO())
+        self.assertFalse(Fine.objects.exists())
+
+        call_command("accrue_fines", "--rescan", stdout=StringIO())
+        self.assertEqual(self.fines(), {missed.id: (10, "5.00", False)})
+
+    def test_filter_borrowings_by_is_overdue(self):
+        overdue = self.overdue_borrowing(1)
+        self.overdue_borrowing(3, returned_days_ago=1)
+        on_time = sample_borrowing(self.user)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(BORROWINGS_URL, {"is_overdue": "true"})
+        self.assertEqual([item["id"] for item in res.data["results"]], [overdue.id])
+
+        res = client.get(BORROWINGS_URL, {"is_overdue": "False"})
+        self.assertNotIn(overdue.id, [item["id"] for item in res.data["results"]])
+        self.assertIn(on_time.id, [item["id"] for item in res.data["results"]])
+
+
+class BorrowingBalanceApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.client.force_authenticate(self.admin)
+        self.today = datetime.date.today()
+
+    def borrowing(self, user, due_days_ago, returned_days_ago=None, daily_fee=0.5):
+        borrowing = sample_borrowing(user, book=sample_book(daily_fee=daily_fee))
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            expected_return_date=self.today - datetime.timedelta(days=due_days_ago),
+            actual_return_date=(
+                None
+                if returned_days_ago is None
+                else self.today - datetime.timedelta(days=returned_days_ago)
+            ),
+        )
+        return borrowing
+
+    def test_balances_only_for_admin(self):
+        user = get_user_model().objects.create_user("user@test.com", "testpass")
+        self.client.force_authenticate(user)
+
+        res = self.client.get(BALANCES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_balances_per_user_in_one_aggregate_query(self):
+        debtor = get_user_model().objects.create_user("debtor@test.com", "pass")
+        patron = get_user_model().objects.create_user("patron@test.com", "pass")
+        self.borrowing(debtor, 4, daily_fee=1)
+        self.borrowing(debtor, 3, returned_days_ago=1, daily_fee=2)
+        self.borrowing(debtor, -3)
+        self.borrowing(patron, 1)
+        self.borrowing(patron, 2, returned_days_ago=3)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BALANCES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(
+            [dict(item) for item in res.data["results"]],
+            [
+                {
+                    "user_id": debtor.id,
+                    "email": debtor.email,
+                    "active_loans": 2,
+                    "overdue_loans": 1,
+                    "outstanding_fees": "8.00",
+                },
+                {
+                    "user_id": patron.id,
+                    "email": patron.email,
+                    "active_loans": 1,
+                    "overdue_loans": 1,
+                    "outstanding_fees": "0.50",
+                },
+            ],
+        )
+        selects = [
+            query["sql"]
+            for query in queries.captured_queries
+            if "borrowings_borrowing" in query["sql"]
+        ]
+        # the page and its count
+        self.assertEqual(len(selects), 2)
+
+    def test_balances_for_one_user_and_ordering(self):
+        first = get_user_model().objects.create_user("first@test.com", "pass")
+        second = get_user_model().objects.create_user("second@test.com", "pass")
+        self.borrowing(first, 1)
+        self.borrowing(second, -1)
+        self.borrowing(second, -1)
+
+        res = self.client.get(BALANCES_URL, {"user_id": second.id})
+        self.assertEqual([item["user_id"] for item in res.data["results"]], [second.id])
+
+        res = self.client.get(BALANCES_URL, {"ordering": "-active_loans"})
+        self.assertEqual(
+            [item["user_id"] for item in res.data["results"]], [second.id, first.id]
+        )
+
+    def test_balances_agree_with_fines_after_a_fee_change(self):
+        debtor = get_user_model().objects.create_user("debtor@test.com", "pass")
+        self.borrowing(debtor, 4, daily_fee=1)
+        self.borrowing(debtor, 403, returned_days_ago=400, daily_fee=2)
+        accrue_fines(today=self.today)
+        self.assertEqual(archive_batch(365), 1)
+
+        Book.objects.update(daily_fee=10)
+        res = self.client.get(BALANCES_URL)
+        self.assertEqual(res.data["results"][0]["outstanding_fees"], "10.00")
+        self.assertEqual(Fine.objects.aggregate(total=Sum("amount"))["total"], 10)
+
+        # The open loan keeps accruing at the fee its fine snapshotted
+        tomorrow = self.today + datetime.timedelta(days=1)
+        balance = user_balances(today=tomorrow).get(user_id=debtor.id)
+        accrue_fines(today=tomorrow)
+        self.assertEqual(balance["outstanding_fees"], 11)
+        self.assertEqual(Fine.objects.aggregate(total=Sum("amount"))["total"], 11)
+
+    def test_archiving_keeps_late_fees_in_balance(self):
+        debtor = get_user_model().objects.create_user("debtor@test.com", "pass")
+        self.borrowing(debtor, 403, returned_days_ago=400, daily_fee=1)
+        self.borrowing(debtor, 2, returned_days_ago=1, daily_fee=2)
+        before = self.client.get(BALANCES_URL).data["results"]
+
+        self.assertEqual(archive_batch(365), 1)
+
+        after = self.client.get(BALANCES_URL).data["results"]
+        self.assertEqual(before, after)
+        self.assertEqual(after[0]["outstanding_fees"], "5.00")
+
+        Borrowing.objects.all().delete()
+        res = self.client.get(BALANCES_URL)
+        self.assertEqual(
+            [
+                (item["user_id"], item["outstanding_fees"])
+                for item in res.data["results"]
+            ],
+            [(debtor.id, "3.00")],
+        )
+
+
+class BorrowingArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.other_user = get_user_model().objects.create_user("other@test.com", "pass")
+        self.today = datetime.date.today()
+
+    def returned_borrowing(self, user, days_ago):
+        borrowing = sample_borrowing(user)
+        returned = self.today - datetime.timedelta(days=days_ago)
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            borrow_date=returned - datetime.timedelta(days=3),
+            expected_return_date=returned,
+            actual_return_date=returned,
+        )
+        borrowing.refresh_from_db()
+        return borrowing
+
+    def test_archive_moves_old_returned_borrowings_in_batches(self):
+        old = [self.returned_borrowing(self.user, 400 + index) for index in range(3)]
+        recent = self.returned_borrowing(self.user, 10)
+        active = sample_borrowing(self.user)
+        out = StringIO()
+
+        call_command(
+            "archive_borrowings", "--days", "365", "--batch-size", "2", stdout=out
+        )
+
+        self.assertIn("Archived 3 borrowings", out.getvalue())
+        self.assertEqual(
+            set(Borrowing.objects.values_list("id", flat=True)), {recent.id, active.id}
+        )
+        history = BorrowingHistory.objects.order_by("id")
+        self.assertEqual(
+            [
+                (row.id, row.borrow_date, row.actual_return_date, row.book_id)
+                for row in history
+            ],
+            [
+                (row.id, row.borrow_date, row.actual_return_date, row.book_id)
+                for row in old
+            ],
+        )
+
+    def test_archive_keeps_fines_and_skips_accruing_ones(self):
+        settled = self.returned_borrowing(self.user, 400)
+        accruing = self.returned_borrowing(self.user, 400)
+        Fine.objects.create(
+            borrowing=settled, due_date=self.today, daily_fee=1, is_final=True
+        )
+        Fine.objects.create(borrowing=accruing, due_date=self.today, daily_fee=1)
+
+        call_command("archive_borrowings", stdout=StringIO())
+
+        self.assertEqual(
+            list(BorrowingHistory.objects.values_list("id", flat=True)), [settled.id]
+        )
+        self.assertTrue(Borrowing.objects.filter(pk=accruing.pk).exists())
+        self.assertEqual(Fine.objects.count(), 2)
+
+    def test_returned_list_reads_hot_and_history_tables(self):
+        archived = self.returned_borrowing(self.user, 400)
+        recent = self.returned_borrowing(self.user, 10)
+        self.returned_borrowing(self.other_user, 500)
+        sample_borrowing(self.user)
+        call_command("archive_borrowings", stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = client.get(BORROWINGS_URL, {"is_active": "false"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(
+            [item["id"] for item in res.data["results"]], [recent.id, archived.id]
+        )
+        self.assertEqual(res.data["results"][1]["book"]["id"], archived.book_id)
+        self.assertFalse(res.data["results"][1]["is_active"])
+        # count, page, books
+        self.assertEqual(len(queries), 3)
+
+    def test_returned_list_pages_by_cursor_across_both_tables(self):
+        borrowings = [
+            self.returned_borrowing(self.user, days_ago)
+            for days_ago in (10, 400, 20, 500, 30, 600, 40)
+        ]
+        self.returned_borrowing(self.other_user, 450)
+        call_command("archive_borrowings", stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        params = {"is_active": "false", "pagination": "cursor", "with_count": "true"}
+        with CaptureQueriesContext(connection) as queries:
+            res = client.get(BORROWINGS_URL, params)
+        # count, page, books
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(res.data["count"], 7)
+
+        ids = [item["id"] for item in res.data["results"]]
+        while res.data["next"]:
+            res = client.get(res.data["next"])
+            ids += [item["id"] for item in res.data["results"]]
+        newest_first = sorted(
+            borrowings, key=lambda row: (row.borrow_date, row.id), reverse=True
+        )
+        self.assertEqual(ids, [borrowing.id for borrowing in newest_first])
+
+        res = client.get(res.data["previous"])
+        self.assertEqual(
+            [item["id"] for item in res.data["results"]],
+            [borrowing.id for borrowing in newest_first[:5]],
+        )
+
+    def test_archived_borrowing_can_be_retrieved(self):
+        archived = self.returned_borrowing(self.user, 400)
+        others = self.returned_borrowing(self.other_user, 400)
+        call_command("archive_borrowings", stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(borrowing_detail_url(archived.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["id"], archived.id)
+        self.assertEqual(res.data["book"]["id"], archived.book_id)
+        self.assertFalse(res.data["is_active"])
+        res = client.get(borrowing_detail_url(others.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LoanCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, *books):
+        return self.client.post(
+            CHECKOUT_URL,
+            {
+                "books": [book.id for book in books],
+                "expected_return_date": EXPECTED_RETURN_DATE,
+            },
+            format="json",
+        )
+
+    def test_migration_backfills_counters_of_open_borrowings(self):
+        migration = import_module("borrowings.migrations.0010_backfill_active_loans")
+        book = sample_book()
+        sample_borrowing(user=self.user, book=book)
+        sample_borrowing(user=self.user, book=book)
+        sample_borrowing(
+            user=self.user, book=book, actual_return_date=datetime.date.today()
+        )
+        Book.objects.update(active_loans=0)
+        get_user_model().objects.update(active_loans=0)
+
+        migration.backfill_active_loans(apps, None)
+
+        book.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(book.active_loans, 2)
+        self.assertEqual(self.user.active_loans, 2)
+
+    def test_counters_cannot_go_below_zero(self):
+        book = sample_book()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            release_loans({self.user.id: 1})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Book.objects.filter(pk=book.pk).return_copies()
+
+    def test_saving_stale_instances_keeps_counters(self):
+        book = sample_book()
+        stale_book = Book.objects.get(pk=book.pk)
+        stale_user = get_user_model().objects.get(pk=self.user.pk)
+        self.checkout(book)
+
+        stale_book.title = "New title"
+        stale_book.save()
+        stale_user.first_name = "Name"
+        stale_user.save()
+
+        book.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual((book.title, book.active_loans), ("New title", 1))
+        self.assertEqual((self.user.first_name, self.user.active_loans), ("Name", 1))
+
+    def test_counters_follow_checkouts_and_returns(self):
+        first, second = sample_book(), sample_book()
+        self.checkout(first, second)
+        res = self.client.post(
+            BORROWINGS_URL,
+            {"book": first.id, "expected_return_date": EXPECTED_RETURN_DATE},
+        )
+        self.user.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(self.user.active_loans, 3)
+        self.assertEqual(first.active_loans, 2)
+
+        self.client.post(borrowing_return_url(res.data["id"]))
+        return_borrowings(book_ids=[second.id])
+
+        self.user.refresh_from_db()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(self.user.active_loans, 1)
+        self.assertEqual((first.active_loans, second.active_loans), (1, 0))
+
+    @override_settings(BORROWING_MAX_ACTIVE_LOANS=2)
+    def test_active_loans_limit(self):
+        books = [sample_book() for _ in range(3)]
+
+        res = self.checkout(*books)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("user", res.data)
+
+        self.assertEqual(self.checkout(*books[:2]).status_code, 201)
+        res = self.client.post(
+            BORROWINGS_URL,
+            {"book": books[2].id, "expected_return_date": EXPECTED_RETURN_DATE},
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        books[2].refresh_from_db()
+        self.assertEqual(books[2].inventory, 2)
+
+    def test_reconcile_detects_and_fixes_drift(self):
+        book = sample_book()
+        self.checkout(book)
+        Borrowing.objects.create(
+            book=book, user=self.user, expected_return_date=EXPECTED_RETURN_DATE
+        )
+        out = StringIO()
+
+        call_command("reconcile_loan_counters", stdout=out)
+        self.assertIn("2 loan counters drifted", out.getvalue())
+        book.refresh_from_db()
+        self.assertEqual(book.active_loans, 1)
+
+        call_command("reconcile_loan_counters", "--fix", stdout=StringIO())
+        book.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual((book.active_loans, self.user.active_loans), (2, 2))
+
+        out = StringIO()
+        call_command("reconcile_loan_counters", stdout=out)
+        self.assertIn("in sync", out.getvalue())
+
+
+def hold_cancel_url(hold_id):
+    return reverse("borrowings:holds-cancel", args=[hold_id])
+
+
+class HoldQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = get_user_model().objects.create_user("reader@test.com", "pass")
+        self.first = get_user_model().objects.create_user("first@test.com", "pass")
+        self.second = get_user_model().objects.create_user("second@test.com", "pass")
+        self.book = sample_book(inventory=0)
+        self.client = APIClient()
+
+    def place_hold(self, user, book=None):
+        self.client.force_authenticate(user)
+        return self.client.post(HOLDS_URL, {"book": (book or self.book).id})
+
+    def return_copy(self):
+        borrowing = sample_borrowing(self.reader, book=self.book)
+        return_borrowings(borrowing_ids=[borrowing.id])
+
+    def statuses(self):
+        return dict(Hold.objects.values_list("user_id", "status"))
+
+    def test_hold_only_for_out_of_stock_books_and_once(self):
+        res = self.place_hold(self.first, sample_book(inventory=1))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.place_hold(self.first).status_code, 201)
+        res = self.place_hold(self.first)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_returns_hand_copies_to_the_queue_in_order(self):
+        self.place_hold(self.first)
+        self.place_hold(self.second)
+
+        self.return_copy()
+        self.assertEqual(
+            self.statuses(), {self.first.id: "READY", self.second.id: "WAITING"}
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+        self.return_copy()
+        self.return_copy()
+        self.assertEqual(
+            self.statuses(), {self.first.id: "READY", self.second.id: "READY"}
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_ready_hold_is_picked_up_by_borrowing(self):
+        self.place_hold(self.first)
+        self.return_copy()
+        payload = {"book": self.book.id, "expected_return_date": EXPECTED_RETURN_DATE}
+
+        self.client.force_authenticate(self.second)
+        res = self.client.post(BORROWINGS_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.book.refresh_from_db()
+        loans = self.book.active_loans
+        self.client.force_authenticate(self.first)
+        res = self.client.post(BORROWINGS_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.statuses(), {self.first.id: "FULFILLED"})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+        self.assertEqual(self.book.active_loans, loans + 1)
+
+    def test_ready_hold_is_picked_up_by_cart_checkout(self):
+        self.place_hold(self.first)
+        self.return_copy()
+        other = sample_book(inventory=1)
+
+        res = self.client.post(
+            CHECKOUT_URL,
+            {
+                "books": [self.book.id, other.id],
+                "expected_return_date": EXPECTED_RETURN_DATE,
+            },
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.statuses(), {self.first.id: "FULFILLED"})
+        other.refresh_from_db()
+        self.assertEqual(other.inventory, 0)
+
+    def test_ready_hold_is_claimed_before_a_shelf_copy(self):
+        self.place_hold(self.first)
+        self.return_copy()
+        Book.objects.filter(pk=self.book.pk).restock()
+        payload = {"book": self.book.id, "expected_return_date": EXPECTED_RETURN_DATE}
+
+        self.client.force_authenticate(self.first)
+        res = self.client.post(BORROWINGS_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.statuses(), {self.first.id: "FULFILLED"})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_cart_claims_ready_hold_before_a_shelf_copy(self):
+        self.place_hold(self.first)
+        self.return_copy()
+        Book.objects.filter(pk=self.book.pk).restock()
+
+        res = self.client.post(
+            CHECKOUT_URL,
+            {"books": [self.book.id], "expected_return_date": EXPECTED_RETURN_DATE},
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.statuses(), {self.first.id: "FULFILLED"})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_expired_and_cancelled_holds_pass_the_copy_on(self):
+        self.place_hold(self.first)
+        self.place_hold(self.second)
+        self.return_copy()
+        self.return_copy()
+        third = get_user_model().objects.create_user("third@test.com", "pass")
+        self.place_hold(third)
+        Hold.objects.filter(user=self.first).update(
+            expires_at=timezone.now() - datetime.timedelta(minutes=1)
+        )
+
+        self.assertEqual(expire_batch(), 1)
+        self.assertEqual(self.statuses()[self.first.id], "EXPIRED")
+        self.assertEqual(self.statuses()[third.id], "READY")
+
+        self.client.force_authenticate(self.second)
+        hold = Hold.objects.get(user=self.second)
+        res = self.client.post(hold_cancel_url(hold.id))
+        self.assertEqual(res.data["status"], "CANCELLED")
+        res = self.client.post(hold_cancel_url(hold.id))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_expire_holds_command(self):
+        self.place_hold(self.first)
+        self.return_copy()
+        Hold.objects.update(expires_at=timezone.now() - datetime.timedelta(days=1))
+        out = StringIO()
+
+        call_command("expire_holds", "--batch-size", "1", stdout=out)
+
+        self.assertIn("Expired 1 holds", out.getvalue())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_users_only_see_their_holds(self):
+        self.place_hold(self.first)
+        self.place_hold(self.second)
+
+        res = self.client.get(HOLDS_URL)
+
+        self.assertEqual(
+            [item["user"] for item in res.data["results"]], [self.second.id]
+        )
+
+
+class FailingSink(outbox.Sink):
+    def deliver(self, events):
+        raise ConnectionError("sink is down")
+
+
+class PoisonSink(outbox.Sink):
+    def deliver(self, events):
+        if any(event["payload"].get("poison") for event in events):
+            raise ValueError("cannot deliver")
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def events(self):
+        return list(
+            OutboxEvent.objects.order_by("id").values_list("event_type", "payload")
+        )
+
+    def test_checkout_and_return_write_events(self):
+        book = sample_book()
+        res = self.client.post(
+            BORROWINGS_URL,
+            {"book": book.id, "expected_return_date": EXPECTED_RETURN_DATE},
+        )
+        self.client.post(borrowing_return_url(res.data["id"]))
+
+        payload = {
+            "borrowing_id": res.data["id"],
+            "book_id": book.id,
+            "user_id": self.user.id,
+        }
+        self.assertEqual(
+            self.events(),
+            [
+                (
+                    "borrowing.created",
+                    {**payload, "expected_return_date": str(EXPECTED_RETURN_DATE)},
+                ),
+                (
+                    "borrowing.returned",
+                    {**payload, "actual_return_date": str(datetime.date.today())},
+                ),
+            ],
+        )
+
+    def test_cart_and_bulk_return_write_events_with_one_insert(self):
+        books = [sample_book() for _ in range(3)]
+        payload = {
+            "books": [book.id for book in books],
+            "expected_return_date": EXPECTED_RETURN_DATE,
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(CHECKOUT_URL, payload, format="json")
+        return_borrowings(book_ids=payload["books"])
+
+        inserts = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith('INSERT INTO "borrowings_outboxevent"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            [event_type for event_type, _ in self.events()],
+            ["borrowing.created"] * 3 + ["borrowing.returned"] * 3,
+        )
+
+    def test_no_event_when_checkout_fails(self):
+        book = sample_book(inventory=0)
+
+        self.client.post(
+            BORROWINGS_URL,
+            {"book": book.id, "expected_return_date": EXPECTED_RETURN_DATE},
+        )
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_drain_delivers_in_order_and_removes_events(self):
+        outbox.record("test.event", [{"n": n} for n in range(5)])
+        target = queue.Queue()
+        sink = outbox.LocalQueueSink(target)
+
+        self.assertEqual(outbox.drain_batch([sink], batch_size=3), 3)
+        self.assertEqual(outbox.drain_batch([sink], batch_size=3), 2)
+        self.assertEqual(outbox.drain_batch([sink], batch_size=3), 0)
+
+        messages = [target.get_nowait() for _ in range(target.qsize())]
+        self.assertEqual(
+            [message["payload"]["n"] for message in messages], [0, 1, 2, 3, 4]
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failed_delivery_keeps_events_for_retry(self):
+        outbox.record("test.event", [{"n": 1}])
+        target = queue.Queue()
+
+        with self.assertRaises(ConnectionError):
+            outbox.drain_batch([outbox.LocalQueueSink(target), FailingSink()])
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertIn("sink is down", event.last_error)
+        self.assertEqual(outbox.drain_batch([outbox.LocalQueueSink(target)]), 0)
+
+        outbox.drain_batch([outbox.LocalQueueSink(target)], now=event.next_attempt_at)
+        # the first sink got the event twice, consumers dedupe by id
+        first, second = target.get_nowait(), target.get_nowait()
+        self.assertEqual(first["id"], second["id"])
+
+    @override_settings(BORROWING_OUTBOX_MAX_ATTEMPTS=2)
+    def test_undeliverable_event_does_not_block_later_events(self):
+        outbox.record("test.event", [{"poison": True}, {"n": 1}, {"n": 2}])
+        target = queue.Queue()
+        sinks = [PoisonSink(), outbox.LocalQueueSink(target)]
+        now = timezone.now()
+
+        with self.assertRaises(ValueError):
+            outbox.drain_batch(sinks, now=now)
+        outbox.record("test.event", [{"n": 3}])
+        self.assertEqual(outbox.drain_batch(sinks, now=now), 1)
+
+        # After the delay the failed batch is retried one event at a time
+        later = now + datetime.timedelta(hours=1)
+        with self.assertRaises(ValueError):
+            outbox.drain_batch(sinks, now=later)
+        self.assertEqual(outbox.drain_batch(sinks, now=later), 1)
+        self.assertEqual(outbox.drain_batch(sinks, now=later), 1)
+        self.assertEqual(outbox.drain_batch(sinks, now=later), 0)
+
+        messages = [target.get_nowait() for _ in range(target.qsize())]
+        self.assertEqual([message["payload"]["n"] for message in messages], [3, 1, 2])
+        dead_letter = OutboxEvent.objects.get()
+        self.assertEqual(dead_letter.payload, {"poison": True})
+        self.assertIsNotNone(dead_letter.dead_lettered_at)
+        self.assertEqual(outbox.drain_batch(sinks, now=later), 0)
+
+        self.assertEqual(outbox.requeue_dead_letters(), 1)
+        self.assertEqual(outbox.pending_events().get(), dead_letter)
+
+    def test_sink_without_deliver_fails_when_created(self):
+        class IncompleteSink(outbox.Sink):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteSink()
+
+    def test_drain_outbox_command_with_file_sink(self):
+        outbox.record("test.event", [{"n": 1}, {"n": 2}])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/outbox.ndjson"
+            sinks = [("borrowings.outbox.FileSink", {"path": path})]
+            with override_settings(BORROWING_OUTBOX_SINKS=sinks):
+                out = StringIO()
+                call_command("drain_outbox", stdout=out)
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+
+        self.assertIn("Delivered 2 events", out.getvalue())
+        self.assertEqual([line["payload"] for line in lines], [{"n": 1}, {"n": 2}])
+
+
+class BorrowingSaveQueryCountTests(TestCase):
+    """Per-checkout query counts of the validated and the trusted write paths"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("test@test.com", "testpass")
+        self.book = sample_book()
+
+    def count_queries(self, create):
+        with CaptureQueriesContext(connection) as queries:
+            create(
+                book=self.book,
+                user=self.user,
+                expected_return_date=EXPECTED_RETURN_DATE,
+            )
+        return len(queries)
+
+    def test_trusted_create_skips_foreign_key_lookups(self):
+        validated = self.count_queries(Borrowing.objects.create)
+        trusted = self.count_queries(Borrowing.objects.create_trusted)
+
+        self.assertEqual(validated, 3)
+        self.assertEqual(trusted, 1)
+
+    def test_plain_save_still_validates(self):
+        borrowing = Borrowing(
+            book=self.book,
+            user=self.user,
+            expected_return_date=datetime.date.today() - datetime.timedelta(days=1),
+        )
+
+        with self.assertRaises(DjangoValidationError):
+            borrowing.save()
+
+    def test_checkout_query_count(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {"expected_return_date": EXPECTED_RETURN_DATE, "book": self.book.id}
+
+        with CaptureQueriesContext(connection) as queries:
+            res = client.post(BORROWINGS_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        # book lookup for validation, user counter UPDATE, ready hold lookup,
+        # book counter UPDATE, borrowing and event INSERTs
+        self.assertEqual(len(statements), 6)
+
+
+class BookFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@admin.com", "testpass", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_book_fragment_is_shared_with_book_endpoint(self):
+        borrowing = sample_borrowing(user=self.user)
+        book = borrowing.book
+        self.client.get(reverse("books:books-detail", args=[book.id]))
+
+        Book.objects.filter(pk=book.id).update(title="Changed", inventory=7)
+        res = self.client.get(borrowing_detail_url(borrowing.id))
+        self.assertEqual(res.data["book"]["title"], "Title")
+        self.assertEqual(res.data["book"]["inventory"], 7)
+
+        bump_catalog_version()
+        res = self.client.get(borrowing_detail_url(borrowing.id))
+        self.assertEqual(res.data["book"]["title"], "Changed")
+
+    def test_borrowing_page_reads_fragments_in_one_round_trip(self):
+        book = sample_book()
+        for _ in range(5):
+            sample_borrowing(user=self.user, book=book)
+        self.client.get(BORROWINGS_URL)
+
+        with mock.patch("books.serializers.cache", wraps=cache) as fragment_cache:
+            res = self.client.get(BORROWINGS_URL)
+
+        self.assertEqual(len(res.data["results"]), 5)
+        self.assertEqual(fragment_cache.get_many.call_count, 1)
+        fragment_cache.get.assert_not_called()
+        fragment_cache.set.assert_not_called()
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    threads = 8
+    checkouts_per_thread = 10
+
+    def checkout(self, book, user, results):
+        try:
+            for _ in range(self.checkouts_per_thread):
+                while True:
+                    serializer = BorrowingCreateSerializer(
+                        data={
+                            "book": book.id,
+                            "expected_return_date": EXPECTED_RETURN_DATE,
+                        }
+                    )
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save(user_id=user.id)
+                        results.append("borrowed")
+                    except ValidationError:
+                        results.append("out of stock")
+                    except OperationalError:
+                        # SQLite allows a single writer, retry when the table is locked
+                        time.sleep(0.001)
+                        continue
+                    break
+        finally:
+            connection.close()
+
+    def test_concurrent_checkouts_never_oversell(self):
+        inventory = 25
+        book = sample_book(inventory=inventory)
+        user = get_user_model().objects.create_user("test@test.com", "testpass")
+        results = []
+
+        workers = [
+            threading.Thread(target=self.checkout, args=(book, user, results))
+            for _ in range(self.threads)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        sys.stderr.write(
+            f"\n{len(results)} checkouts from {self.threads} threads in "
+            f"{elapsed:.2f}s: {len(results) / elapsed:.0f} checkouts/s\n"
+        )
+
+        book.refresh_from_db()
+        self.assertEqual(len(results), self.threads * self.checkouts_per_thread)
+        self.assertEqual(results.count("borrowed"), inventory)
+        self.assertEqual(Borrowing.objects.filter(book=book).count(), inventory)
+        self.assertEqual(book.inventory, 0)
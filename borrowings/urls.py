@@ -1,11 +1,12 @@
 from rest_framework import routers
 
-from borrowings.views import BorrowingViewSet
+from borrowings.views import BorrowingViewSet, HoldViewSet
 
 app_name = "borrowings"
 
 router = routers.DefaultRouter()
 
+router.register("holds", HoldViewSet, basename="holds")
 router.register("", BorrowingViewSet, basename="borrowings")
 
 urlpatterns = router.urls
@@ -1,16 +1,30 @@
 import datetime
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Q, prefetch_related_objects
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from books.models import Book
-from borrowings.models import Borrowing
-from borrowings.paginations import BorrowingPagination
+from books.cache import CatalogVersionMixin
+from books.paginations import CursorPaginationOptInMixin
+from borrowings.archive import HISTORY_FIELDS
+from borrowings.holds import cancel_hold
+from borrowings.models import Borrowing, BorrowingHistory, Hold
+from borrowings.fines import BALANCE_ORDERINGS, user_balances
+from borrowings.paginations import (
+    BorrowingBalancePagination,
+    BorrowingCursorPagination,
+    BorrowingHistoryCursorPagination,
+    BorrowingPagination,
+)
+from borrowings.returns import finish_returns, return_borrowings
 from borrowings.permissions import (
     IsAdminOrIfIsOwnerGetPost,
 )
@@ -19,17 +33,23 @@ from borrowings.serializers import (
     BorrowingDetailSerializer,
     BorrowingCreateSerializer,
     BorrowingSerializer, BorrowingReturnSerializer,
+    BorrowingBulkReturnSerializer,
+    BorrowingBulkReturnResultSerializer,
+    BorrowingCheckoutSerializer,
+    BorrowingBalanceSerializer,
+    HoldSerializer,
 )
 
 
-class BorrowingViewSet(viewsets.ModelViewSet):
-    queryset = Borrowing.objects.prefetch_related(
-        "book__authors",
-        "user",
-    )
+class BorrowingViewSet(
+    CatalogVersionMixin, CursorPaginationOptInMixin, viewsets.ModelViewSet
+):
+    queryset = Borrowing.objects.select_related("book")
     serializer_class = BorrowingSerializer
     permission_classes = (IsAdminOrIfIsOwnerGetPost,)
     pagination_class = BorrowingPagination
+    cursor_pagination_class = BorrowingCursorPagination
+    history_cursor_pagination_class = BorrowingHistoryCursorPagination
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -46,25 +66,55 @@ class BorrowingViewSet(viewsets.ModelViewSet):
         return BorrowingSerializer
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
     def get_queryset(self):
+        queryset = self.filter_borrowings(self.queryset)
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related("book__authors")
+        return queryset
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != "retrieve":
+                raise
+        # Archived borrowings are read back from the history table
+        history = self.filter_borrowings(BorrowingHistory.objects.all())
+        row = get_object_or_404(history.values(*HISTORY_FIELDS), pk=self.kwargs["pk"])
+        borrowing = Borrowing(**row)
+        prefetch_related_objects([borrowing], "book__authors")
+        self.check_object_permissions(self.request, borrowing)
+        return borrowing
+
+    def filter_borrowings(self, queryset):
+        """Applies the query params filters to borrowings or their history"""
         user_id = self.request.query_params.get("user_id")
         is_active = self.request.query_params.get("is_active")
+        is_overdue = self.request.query_params.get("is_overdue")
 
-        queryset = self.queryset
         if is_active:
             is_active = is_active.lower()
             if is_active == "true":
                 queryset = queryset.filter(actual_return_date__isnull=True)
             elif is_active == "false":
-                queryset = queryset.exclude(actual_return_date__isnull=True)
+                queryset = queryset.filter(actual_return_date__isnull=False)
+
+        if is_overdue:
+            is_overdue = is_overdue.lower()
+            overdue = Q(
+                actual_return_date__isnull=True,
+                expected_return_date__lt=datetime.date.today(),
+            )
+            if is_overdue == "true":
+                queryset = queryset.filter(overdue)
+            elif is_overdue == "false":
+                queryset = queryset.exclude(overdue)
 
         if user_id:
             queryset = queryset.filter(user_id=user_id)
 
-        queryset = queryset.distinct()
-
         if not self.request.user.is_staff:
             return queryset.filter(user=self.request.user.id)
         return queryset
@@ -76,7 +126,16 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 type=OpenApiTypes.STR,
                 description=(
                     "Filter by bool value regardless of letter case, "
-                    "active borrowing or not. (ex. ?is_active=true; ?is_active=false)"
+                    "active borrowing or not. (ex. ?is_active=true; ?is_active=false). "
+                    "?is_active=false includes archived borrowings"
+                ),
+            ),
+            OpenApiParameter(
+                "is_overdue",
+                type=OpenApiTypes.STR,
+                description=(
+                    "Filter by bool value regardless of letter case, active borrowing "
+                    "past its expected_return_date or not. (ex. ?is_overdue=true)"
                 ),
             ),
             OpenApiParameter(
@@ -84,22 +143,92 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 type=OpenApiTypes.INT,
                 description="Filter by user of borrowings. Can only be used by the admin (ex. ?user_id=1)",
             ),
+            OpenApiParameter(
+                "pagination",
+                type=OpenApiTypes.STR,
+                description=(
+                    "Use ?pagination=cursor for keyset pages, newest borrowings first, "
+                    "with next/previous cursors and no total count"
+                ),
+            ),
+            OpenApiParameter(
+                "with_count",
+                type=OpenApiTypes.BOOL,
+                description=(
+                    "With cursor pagination, include a total count "
+                    "cached for up to a minute (ex. ?with_count=true)"
+                ),
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
+        if request.query_params.get("is_active", "").lower() == "false":
+            return self.list_returned(request)
         return super().list(request, *args, **kwargs)
 
+    def list_returned(self, request):
+        """
+        Returned borrowings live in the borrowings table until they are
+        archived and in the history table after, both are read in one UNION
+        """
+        history = self.filter_borrowings(BorrowingHistory.objects.all())
+        parts = [
+            self.get_queryset().values(*HISTORY_FIELDS),
+            history.values(*HISTORY_FIELDS),
+        ]
+
+        if isinstance(self.paginator, self.cursor_pagination_class):
+            # Cursors filter each part, the union itself can't be filtered
+            self._paginator = self.history_cursor_pagination_class()
+            page = self.paginate_queryset(parts)
+        else:
+            queryset = parts[0].union(parts[1], all=True)
+            page = self.paginate_queryset(queryset.order_by("-borrow_date", "-id"))
+        borrowings = [Borrowing(**row) for row in page]
+        prefetch_related_objects(borrowings, "book")
+
+        serializer = self.get_serializer(borrowings, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @extend_schema(
         request=BorrowingCreateSerializer,
         responses={status.HTTP_201_CREATED: BorrowingCreateSerializer},
         description=(
-            "Creation takes -1 away from the book inventory. "
+            "Creation picks up the copy kept for the user's ready hold on the "
+            "book, otherwise it takes -1 away from the book inventory. "
             "Only an authorized user can create borrowings"
         ),
     )
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    @extend_schema(
+        request=BorrowingCheckoutSerializer,
+        responses={status.HTTP_201_CREATED: BorrowingSerializer(many=True)},
+        description=(
+            "Borrows several books at once with a shared expected_return_date. "
+            "Picks up the copies kept for the user's ready holds and takes -1 "
+            "away from the inventory of the other books; if any of them "
+            "is out of stock nothing is borrowed"
+        ),
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="checkout",
+        permission_classes=[IsAdminOrIfIsOwnerGetPost],
+    )
+    def checkout(self, request):
+        serializer = BorrowingCheckoutSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        borrowings = serializer.save(user_id=request.user.id)
+        return Response(
+            BorrowingSerializer(borrowings, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
     @transaction.atomic()
     @action(
         methods=["POST"],
@@ -109,20 +238,167 @@ class BorrowingViewSet(viewsets.ModelViewSet):
     )
     def return_view(self, request, pk=None):
         """
-        Return adds +1 to the book inventory, and changes the actual_return_date to the current date.
-        A second return is not possible. Only borrowings that belong to an authorized user can be returned.
+        Return hands the copy to the first waiting hold on the book, or adds +1
+        to the book inventory if nobody is waiting, and changes the actual_return_date
+        to the current date. A second return is not possible. Only borrowings that belong to an authorized user can be returned.
         """
         borrowing = self.get_object()
-        if not borrowing.is_active:
+        return_date = datetime.date.today()
+        if not Borrowing.objects.filter(pk=borrowing.pk).close(return_date):
             raise ValidationError(
                 {
                     "actual_return_date": f"This borrowing is no longer active, re-closing is not possible"
                 }
             )
-        borrowing.actual_return_date = datetime.date.today()
+        finish_returns(
+            [
+                {
+                    "borrowing_id": borrowing.id,
+                    "book_id": borrowing.book_id,
+                    "user_id": borrowing.user_id,
+                }
+            ],
+            return_date,
+        )
+
+        borrowing.actual_return_date = return_date
         serializer = self.get_serializer(borrowing)
-        book = Book.objects.get(pk=borrowing.book.id)
-        book.inventory += 1
-        book.save()
-        borrowing.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        request=BorrowingBulkReturnSerializer,
+        responses={status.HTTP_200_OK: BorrowingBulkReturnResultSerializer(many=True)},
+        description=(
+            "Returns many borrowings in one transaction, by borrowing ids or "
+            "by scanned book ids (each scan closes the oldest active borrowing "
+            "of the book). Responds with a result per item. Only for admin"
+        ),
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="bulk-return",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_return(self, request):
+        serializer = BorrowingBulkReturnSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = return_borrowings(**serializer.validated_data)
+        return Response(
+            BorrowingBulkReturnResultSerializer(results, many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "user_id",
+                type=OpenApiTypes.INT,
+                description="Balance of a single user (ex. ?user_id=1)",
+            ),
+            OpenApiParameter(
+                "ordering",
+                type=OpenApiTypes.STR,
+                enum=tuple(
+                    prefix + field
+                    for field in BALANCE_ORDERINGS
+                    for prefix in ("-", "")
+                ),
+                description="Sort users, biggest debtors first by default",
+            ),
+        ],
+        responses={status.HTTP_200_OK: BorrowingBalanceSerializer(many=True)},
+        description=(
+            "Active loans, overdue loans and late fees per user, "
+            "computed in one aggregate query. Late fees match the fine records, "
+            "fines still accruing are counted up to today. Only for admin"
+        ),
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="balances",
+        permission_classes=[IsAdminUser],
+    )
+    def balances(self, request):
+        queryset = user_balances()
+
+        user_id = request.query_params.get("user_id")
+        if user_id:
+            queryset = queryset.filter(user_id=user_id)
+
+        ordering = request.query_params.get("ordering")
+        if ordering and ordering.lstrip("-") in BALANCE_ORDERINGS:
+            queryset = queryset.order_by(ordering, "user_id")
+
+        paginator = BorrowingBalancePagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = BorrowingBalanceSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class HoldViewSet(
+    mixins.ListModelMixin,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = Hold.objects.all()
+    serializer_class = HoldSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = BorrowingPagination
+
+    def get_queryset(self):
+        hold_status = self.request.query_params.get("status")
+
+        queryset = self.queryset.order_by("-id")
+        if hold_status:
+            queryset = queryset.filter(status=hold_status.upper())
+
+        if not self.request.user.is_staff:
+            return queryset.filter(user_id=self.request.user.id)
+        return queryset
+
+    def perform_create(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save(user_id=self.request.user.id)
+        except IntegrityError:
+            raise ValidationError({"book": "You already have a hold on this book."})
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "status",
+                type=OpenApiTypes.STR,
+                enum=tuple(Hold.StatusChoices.values),
+                description="Filter holds by status (ex. ?status=ready)",
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(
+        request=HoldSerializer,
+        responses={status.HTTP_201_CREATED: HoldSerializer},
+        description=(
+            "Queues the user for an out of stock book. When a copy is returned "
+            "the first waiting hold becomes READY and the copy is kept for it "
+            "until expires_at, borrowing the book then picks it up"
+        ),
+    )
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @extend_schema(request=None, responses={status.HTTP_200_OK: HoldSerializer})
+    @action(methods=["POST"], detail=True, url_path="cancel")
+    def cancel(self, request, pk=None):
+        """Cancels a waiting or ready hold, a kept copy goes to the next in line"""
+        hold = self.get_object()
+        if not cancel_hold(hold.pk):
+            raise ValidationError(
+                {"status": "Only waiting or ready holds can be cancelled"}
+            )
+        hold.refresh_from_db()
+        return Response(self.get_serializer(hold).data, status=status.HTTP_200_OK)
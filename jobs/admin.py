@@ -0,0 +1,6 @@
+from django.contrib import admin
+
+from jobs.models import Job, JobSchedule
+
+admin.site.register(Job)
+admin.site.register(JobSchedule)
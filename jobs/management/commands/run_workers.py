@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.processes import work
+from jobs.queue import sync_schedules
+from jobs.worker import DEFAULT_LEASE, DEFAULT_POLL_INTERVAL
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs background jobs in N worker processes, each claims one job at "
+        "a time from the jobs table. Schedules from JOB_SCHEDULES are synced "
+        "on start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--lease",
+            type=int,
+            default=DEFAULT_LEASE,
+            help="Seconds a job stays claimed, renewed while it runs",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling for new jobs",
+        )
+
+    def handle(self, *args, **options):
+        sync_schedules()
+
+        if options["processes"] <= 1:
+            processed = work(options)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
+            return
+
+        # Spawn works the same everywhere, fork is missing on Windows and
+        # unsafe on macOS. Children open their own database connections.
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=work, args=(options,), daemon=True)
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Stopped {len(processes)} worker processes")
+        )
@@ -0,0 +1,74 @@
+from django.db import models
+from django.utils import timezone
+
+
+class JobQuerySet(models.QuerySet):
+    def due(self, now=None):
+        return self.filter(
+            status=Job.StatusChoices.QUEUED, run_at__lte=now or timezone.now()
+        )
+
+    def expired(self, now=None):
+        """Running jobs whose worker let the lease run out"""
+        return self.filter(
+            status=Job.StatusChoices.RUNNING, locked_until__lt=now or timezone.now()
+        )
+
+
+class Job(models.Model):
+    """A call of a registered task, claimed by a worker for the lease time"""
+
+    class StatusChoices(models.TextChoices):
+        QUEUED = "QUEUED"
+        RUNNING = "RUNNING"
+        DONE = "DONE"
+        FAILED = "FAILED"
+
+    task = models.CharField(max_length=128)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=StatusChoices.choices,
+        default=StatusChoices.QUEUED,
+    )
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["run_at", "id"],
+                name="jobs_job_queued_idx",
+                condition=models.Q(status="QUEUED"),
+            ),
+            models.Index(
+                fields=["locked_until"],
+                name="jobs_job_running_idx",
+                condition=models.Q(status="RUNNING"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.id}: {self.status}"
+
+
+class JobSchedule(models.Model):
+    """Enqueues a task every `interval` seconds, see JOB_SCHEDULES"""
+
+    name = models.CharField(max_length=64, unique=True)
+    task = models.CharField(max_length=128)
+    kwargs = models.JSONField(default=dict, blank=True)
+    interval = models.PositiveIntegerField(help_text="Seconds between runs")
+    next_run_at = models.DateTimeField(default=timezone.now)
+    enabled = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.task} every {self.interval}s"
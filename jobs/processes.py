@@ -0,0 +1,13 @@
+import django
+
+
+def work(options) -> int:
+    """
+    Runs a worker in a process of run_workers. Spawned processes start a
+    fresh interpreter, so Django is set up before the worker is imported.
+    """
+    django.setup()
+    from jobs.worker import Worker
+
+    worker = Worker(lease=options["lease"], poll_interval=options["poll_interval"])
+    return worker.run(burst=options["burst"])
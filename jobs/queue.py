@@ -0,0 +1,176 @@
+import datetime
+import traceback
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from jobs.models import Job, JobSchedule
+from jobs.registry import TASKS, get_task
+
+CLAIM_CANDIDATES = 5
+MAX_RETRY_DELAY = 60 * 60
+
+
+def enqueue(task, run_at=None, **kwargs) -> Job:
+    """
+    Queues a call of a registered task, by name or by the task itself.
+    The kwargs are stored as JSON, so they must be JSON serializable.
+    """
+    task = get_task(task) if isinstance(task, str) else task
+    return Job.objects.create(
+        task=task.name,
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=task.max_attempts,
+    )
+
+
+def retry_delay(task, attempts) -> datetime.timedelta:
+    """Exponential backoff: retry_delay, then twice that, and so on"""
+    seconds = task.retry_delay * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(seconds, MAX_RETRY_DELAY))
+
+
+def claim_job(worker_id, lease):
+    """
+    Takes the oldest due job for `lease` seconds. SKIP LOCKED keeps workers
+    apart where the database has it, the conditional UPDATE makes sure only
+    one of them wins a job everywhere else.
+    """
+    # Without row locks (SQLite) the SELECT would only upgrade to a write
+    # lock inside the transaction and deadlock competing workers
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic() if skip_locked else nullcontext():
+        return _claim(worker_id, lease, skip_locked)
+
+
+def _claim(worker_id, lease, skip_locked):
+    now = timezone.now()
+    candidates = Job.objects.due(now).order_by("run_at", "id")
+    if skip_locked:
+        candidates = candidates.select_for_update(skip_locked=True)
+
+    # Other workers may win every candidate, then look at the next ones
+    while job_ids := list(candidates.values_list("id", flat=True)[:CLAIM_CANDIDATES]):
+        for job_id in job_ids:
+            claimed = (
+                Job.objects.due(now)
+                .filter(pk=job_id)
+                .update(
+                    status=Job.StatusChoices.RUNNING,
+                    locked_by=worker_id,
+                    locked_until=now + datetime.timedelta(seconds=lease),
+                    attempts=F("attempts") + 1,
+                )
+            )
+            if claimed:
+                return Job.objects.get(pk=job_id)
+    return None
+
+
+def renew_lease(job, worker_id, lease) -> bool:
+    """
+    Extends the lease of a job the worker still holds by `lease` seconds
+    from now. Returns False once the job was requeued or finished.
+    """
+    return bool(
+        Job.objects.filter(
+            pk=job.pk, status=Job.StatusChoices.RUNNING, locked_by=worker_id
+        ).update(locked_until=timezone.now() + datetime.timedelta(seconds=lease))
+    )
+
+
+def run_job(job, worker_id) -> bool:
+    """
+    Runs a claimed job and records the outcome, failures are queued again
+    with backoff until max_attempts. The outcome is only written while the
+    worker still holds the lease. Returns whether the task succeeded.
+    """
+    owned = Job.objects.filter(
+        pk=job.pk, status=Job.StatusChoices.RUNNING, locked_by=worker_id
+    )
+    task = TASKS.get(job.task)
+    try:
+        get_task(job.task)(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if task is not None and job.attempts < job.max_attempts:
+            owned.update(
+                status=Job.StatusChoices.QUEUED,
+                run_at=timezone.now() + retry_delay(task, job.attempts),
+                locked_by="",
+                locked_until=None,
+                last_error=error,
+            )
+        else:
+            owned.update(
+                status=Job.StatusChoices.FAILED,
+                locked_until=None,
+                finished_at=timezone.now(),
+                last_error=error,
+            )
+        return False
+
+    owned.update(
+        status=Job.StatusChoices.DONE, locked_until=None, finished_at=timezone.now()
+    )
+    return True
+
+
+def requeue_expired(now=None) -> int:
+    """
+    Jobs of workers that died or overran their lease go back to the queue,
+    or fail if they are out of attempts
+    """
+    now = now or timezone.now()
+    expired = Job.objects.expired(now)
+    failed = expired.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.StatusChoices.FAILED,
+        locked_until=None,
+        finished_at=now,
+        last_error="Lease expired",
+    )
+    requeued = expired.update(
+        status=Job.StatusChoices.QUEUED,
+        locked_by="",
+        locked_until=None,
+        last_error="Lease expired",
+    )
+    return failed + requeued
+
+
+def enqueue_due_schedules(now=None) -> int:
+    """
+    Enqueues a job for every schedule that is due. Moving next_run_at is
+    conditional on its old value, so one worker enqueues each run.
+    """
+    now = now or timezone.now()
+    enqueued = 0
+    for schedule in JobSchedule.objects.filter(enabled=True, next_run_at__lte=now):
+        interval = datetime.timedelta(seconds=schedule.interval)
+        next_run_at = max(schedule.next_run_at + interval, now)
+        with transaction.atomic():
+            moved = JobSchedule.objects.filter(
+                pk=schedule.pk, next_run_at=schedule.next_run_at
+            ).update(next_run_at=next_run_at)
+            if moved:
+                enqueue(schedule.task, **schedule.kwargs)
+                enqueued += 1
+    return enqueued
+
+
+def sync_schedules() -> None:
+    """Creates or updates the schedules declared in JOB_SCHEDULES"""
+    for name, options in getattr(settings, "JOB_SCHEDULES", {}).items():
+        get_task(options["task"])
+        JobSchedule.objects.update_or_create(
+            name=name,
+            defaults={
+                "task": options["task"],
+                "kwargs": options.get("kwargs", {}),
+                "interval": options["interval"],
+            },
+        )
@@ -0,0 +1,40 @@
+TASKS = {}
+
+
+class Task:
+    """A function that can be enqueued by name and run by the workers"""
+
+    def __init__(self, func, name, max_attempts, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def __repr__(self):
+        return f"<Task {self.name}>"
+
+
+def task(name, max_attempts=3, retry_delay=10):
+    """
+    Registers the decorated function under `name`. A failed run is retried
+    up to max_attempts times in total, waiting retry_delay seconds doubled
+    on every attempt.
+    """
+
+    def register(func):
+        if name in TASKS:
+            raise ValueError(f"Task {name} is already registered")
+        TASKS[name] = Task(func, name, max_attempts, retry_delay)
+        return TASKS[name]
+
+    return register
+
+
+def get_task(name) -> Task:
+    try:
+        return TASKS[name]
+    except KeyError:
+        raise LookupError(f"Unknown task {name}") from None
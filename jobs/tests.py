@@ -0,0 +1,182 @@
+import datetime
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from books.models import Book
+from jobs.models import Job, JobSchedule
+from jobs.queue import (
+    claim_job,
+    enqueue,
+    enqueue_due_schedules,
+    renew_lease,
+    requeue_expired,
+    run_job,
+    sync_schedules,
+)
+from jobs.registry import task
+from jobs.worker import Worker
+
+CALLS = []
+
+
+@task("tests.record")
+def record(value=None):
+    CALLS.append(value)
+
+
+@task("tests.flaky", max_attempts=2, retry_delay=30)
+def flaky():
+    raise RuntimeError("Flaky")
+
+
+@task("tests.outlive_lease")
+def outlive_lease(seconds):
+    time.sleep(seconds)
+    CALLS.append(requeue_expired())
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_stores_task_and_kwargs(self):
+        job = enqueue("tests.record", value=1)
+        same_task = enqueue(record, value=2)
+
+        self.assertEqual((job.task, job.kwargs), ("tests.record", {"value": 1}))
+        self.assertEqual(same_task.task, "tests.record")
+        self.assertEqual(job.status, Job.StatusChoices.QUEUED)
+
+    def test_enqueue_unknown_task(self):
+        with self.assertRaises(LookupError):
+            enqueue("tests.missing")
+
+    def test_worker_runs_due_jobs_in_order(self):
+        enqueue(record, value=1)
+        enqueue(record, value=2)
+        enqueue(record, run_at=timezone.now() + datetime.timedelta(hours=1), value=3)
+
+        self.assertEqual(Worker().run(burst=True), 2)
+        self.assertEqual(CALLS, [1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.StatusChoices.DONE).count(), 2)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        job = enqueue(record)
+
+        claimed = claim_job("worker-1", lease=60)
+
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, Job.StatusChoices.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim_job("worker-2", lease=60))
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        job = enqueue(flaky)
+
+        before = timezone.now()
+        self.assertFalse(run_job(claim_job("worker", lease=60), "worker"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.StatusChoices.QUEUED)
+        self.assertIn("RuntimeError: Flaky", job.last_error)
+        self.assertGreaterEqual(job.run_at, before + datetime.timedelta(seconds=30))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertFalse(run_job(claim_job("worker", lease=60), "worker"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.StatusChoices.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_expired_lease_is_requeued(self):
+        job = enqueue(record)
+        stale = claim_job("dead-worker", lease=60)
+
+        later = timezone.now() + datetime.timedelta(minutes=2)
+        self.assertEqual(requeue_expired(later), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.StatusChoices.QUEUED)
+
+        claimed = claim_job("worker", lease=60)
+        run_job(stale, "dead-worker")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ("RUNNING", "worker"))
+
+        run_job(claimed, "worker")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.StatusChoices.DONE, 2))
+
+    def test_renew_lease_only_for_the_holder(self):
+        enqueue(record)
+        job = claim_job("worker", lease=60)
+
+        self.assertTrue(renew_lease(job, "worker", lease=600))
+        self.assertFalse(renew_lease(job, "other-worker", lease=600))
+        later = timezone.now() + datetime.timedelta(minutes=5)
+        self.assertEqual(requeue_expired(later), 0)
+
+        run_job(job, "worker")
+        self.assertFalse(renew_lease(job, "worker", lease=600))
+
+    def test_due_schedule_enqueues_once_per_interval(self):
+        now = timezone.now()
+        schedule = JobSchedule.objects.create(
+            name="record", task="tests.record", interval=60, next_run_at=now
+        )
+
+        self.assertEqual(enqueue_due_schedules(now), 1)
+        self.assertEqual(enqueue_due_schedules(now), 0)
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.next_run_at, now + datetime.timedelta(seconds=60))
+        self.assertEqual(Job.objects.filter(task="tests.record").count(), 1)
+
+    @override_settings(
+        JOB_SCHEDULES={"record": {"task": "tests.record", "interval": 30}}
+    )
+    def test_sync_schedules_from_settings(self):
+        sync_schedules()
+        sync_schedules()
+
+        self.assertEqual(
+            list(JobSchedule.objects.values_list("name", "task", "interval")),
+            [("record", "tests.record", 30)],
+        )
+
+    @override_settings(JOB_SCHEDULES={})
+    def test_run_workers_command(self):
+        enqueue(record, value=1)
+        out = StringIO()
+
+        call_command("run_workers", processes=1, burst=True, stdout=out)
+
+        self.assertEqual(CALLS, [1])
+        self.assertIn("Processed 1 jobs", out.getvalue())
+
+    def test_export_catalog_task(self):
+        Book.objects.create(title="Title", cover="HARD", inventory=1, daily_fee=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "books.csv")
+            enqueue("books.export_catalog", path=path, output="csv")
+            Worker().run(burst=True)
+
+            with open(path) as file:
+                self.assertEqual(len(file.readlines()), 2)
+
+
+class LeaseRenewalTests(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_job_running_past_its_lease_is_not_requeued(self):
+        job = enqueue(outlive_lease, seconds=1.5)
+
+        self.assertTrue(Worker(lease=1).run_once())
+
+        # The task itself looked for expired leases after outliving the first one
+        self.assertEqual(CALLS, [0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.StatusChoices.DONE, 1))
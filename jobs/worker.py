@@ -0,0 +1,97 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.db import DatabaseError, close_old_connections, connection
+
+from jobs.queue import (
+    claim_job,
+    enqueue_due_schedules,
+    renew_lease,
+    requeue_expired,
+    run_job,
+)
+
+DEFAULT_LEASE = 5 * 60
+DEFAULT_POLL_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseKeeper(threading.Thread):
+    """
+    Renews the lease of a running job three times per lease, so a task that
+    runs longer than the lease is not requeued and run a second time. Only a
+    worker that died stops renewing, its job runs again elsewhere, which is
+    why tasks have to be idempotent.
+    """
+
+    def __init__(self, job, worker_id, lease):
+        super().__init__(name=f"lease-{job.pk}", daemon=True)
+        self.job = job
+        self.worker_id = worker_id
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease / 3):
+                try:
+                    if not renew_lease(self.job, self.worker_id, self.lease):
+                        return
+                except DatabaseError:
+                    logger.exception("Could not renew the lease of job %s", self.job.pk)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Worker:
+    """
+    Claims and runs jobs one at a time. Before each claim it also enqueues
+    due schedules and requeues jobs with expired leases, every worker does
+    that so the queue keeps going as long as any of them is alive.
+    """
+
+    def __init__(self, lease=DEFAULT_LEASE, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.processed = 0
+
+    def run_once(self) -> bool:
+        """Runs one job if there is a due one, returns whether there was"""
+        close_old_connections()
+        requeue_expired()
+        enqueue_due_schedules()
+
+        job = claim_job(self.id, self.lease)
+        if job is None:
+            return False
+        keeper = LeaseKeeper(job, self.id, self.lease)
+        keeper.start()
+        try:
+            run_job(job, self.id)
+        finally:
+            keeper.stop()
+        self.processed += 1
+        return True
+
+    def run(self, burst=False) -> int:
+        """Works until stopped, or until the queue is empty with burst=True"""
+        while True:
+            try:
+                if self.run_once():
+                    continue
+                if burst:
+                    return self.processed
+            except DatabaseError:
+                # A busy or restarting database should not kill the worker
+                logger.exception("Worker %s could not reach the queue", self.id)
+            time.sleep(self.poll_interval)
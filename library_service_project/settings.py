@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     "books",
     "users",
     "borrowings",
+    "jobs",
 ]
 
 MIDDLEWARE = [
@@ -87,6 +88,18 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Catalog versions and response caches must be shared between worker
+# processes, so use Redis or Memcached when running more than one.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -137,7 +150,7 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_THROTTLE_RATES": {"anon": "10000/day", "user": "10000/day"},
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.StatelessJWTAuthentication",
     ),
 }
 
@@ -145,6 +158,8 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60 * 60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": False,
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.TokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.TokenRefreshSerializer",
 }
 
 SPECTACULAR_SETTINGS = {
@@ -159,3 +174,35 @@ SPECTACULAR_SETTINGS = {
         "defaultModelExpandDepth": 2,
     },
 }
+
+# Maximum number of active borrowings per user, None for no limit
+
+BORROWING_MAX_ACTIVE_LOANS = None
+
+# Where drain_outbox delivers borrowing events, as (dotted path, kwargs) pairs,
+# e.g. [("borrowings.outbox.FileSink", {"path": BASE_DIR / "outbox.ndjson"})]
+
+BORROWING_OUTBOX_SINKS = []
+
+# Failed outbox deliveries are retried after this many seconds, doubling every
+# attempt, and become dead letters after BORROWING_OUTBOX_MAX_ATTEMPTS
+
+BORROWING_OUTBOX_RETRY_DELAY = 30
+BORROWING_OUTBOX_MAX_ATTEMPTS = 10
+
+# How long token versions and full users are cached for JWT requests,
+# a demotion reaches other processes within this many seconds
+
+TOKEN_USER_CACHE_TIMEOUT = 30
+
+# How often each process loads new token revocations from the database
+
+TOKEN_REVOCATION_REFRESH_INTERVAL = 5
+
+# Periodic jobs, synced to the JobSchedule table when run_workers starts
+
+JOB_SCHEDULES = {
+    "accrue-fines": {"task": "borrowings.accrue_fines", "interval": 60 * 60},
+    "expire-holds": {"task": "borrowings.expire_holds", "interval": 15 * 60},
+    "purge-revoked-tokens": {"task": "users.purge_revoked_tokens", "interval": 60 * 60},
+}
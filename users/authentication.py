@@ -0,0 +1,85 @@
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from users.cache import get_cached_user, get_token_version
+from users.revocation import revocation_list
+
+TOKEN_VERSION_CLAIM = "ver"
+
+
+def add_user_claims(token, user):
+    token["is_staff"] = user.is_staff
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+def check_not_revoked(token) -> None:
+    if revocation_list.is_revoked(token):
+        raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+
+def check_token_version(token) -> None:
+    """
+    Rejects tokens of inactive users and tokens issued before a demotion or
+    a revocation of all tokens. Tokens issued before the version claim was
+    added count as version 0.
+    """
+    version = get_token_version(token[api_settings.USER_ID_CLAIM])
+    if version is None:
+        raise AuthenticationFailed(
+            _("User not found or inactive"), code="user_inactive"
+        )
+    if version != token.get(TOKEN_VERSION_CLAIM, 0):
+        raise AuthenticationFailed(
+            _("Token is outdated, please log in again"), code="token_outdated"
+        )
+
+
+class ClaimsUser(TokenUser):
+    """
+    Request user built from the token claims: id and is_staff cost nothing.
+    Any other attribute comes from the full user, cached for a few seconds.
+    """
+
+    @cached_property
+    def id(self):
+        # The claim is stored as a string, ids are compared with user_id columns
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def instance(self):
+        user = get_cached_user(self.id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return user
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.instance, attr)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication without a user query per request. The token version
+    is checked against a short-TTL cache, so demoted staff and deactivated
+    users lose access within TOKEN_USER_CACHE_TIMEOUT seconds, or at once
+    in the process that saved the change. Revoked tokens are rejected from
+    the in-memory revocation list.
+    """
+
+    def get_user(self, validated_token):
+        check_not_revoked(validated_token)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        check_token_version(validated_token)
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            # Issued before the claims were added, resolve it the old way
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+# Stored for users that are inactive or gone, so they are not looked up again
+MISSING = -1
+
+
+def _timeout() -> int:
+    return getattr(settings, "TOKEN_USER_CACHE_TIMEOUT", 30)
+
+
+def token_version_key(user_id) -> str:
+    return f"users:token_version:{user_id}"
+
+
+def user_key(user_id) -> str:
+    return f"users:user:{user_id}"
+
+
+def get_token_version(user_id):
+    """Current token version of an active user, None for inactive or gone"""
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (
+            get_user_model()
+            .objects.filter(pk=user_id, is_active=True)
+            .values_list("token_version", flat=True)
+            .first()
+        )
+        version = MISSING if version is None else version
+        cache.set(key, version, _timeout())
+    return None if version == MISSING else version
+
+
+def get_cached_user(user_id):
+    """
+    The full user, at most TOKEN_USER_CACHE_TIMEOUT seconds old. Read it,
+    never save it: fields like active_loans may already be stale.
+    """
+    key = user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = get_user_model().objects.filter(pk=user_id).first()
+        cache.set(key, user or MISSING, _timeout())
+    return None if user == MISSING else user
+
+
+def _forget(user_id) -> None:
+    cache.delete_many([token_version_key(user_id), user_key(user_id)])
+
+
+def forget_user(user_id) -> None:
+    """
+    Drops the cached version and user. Inside a transaction they are
+    dropped again on commit, so nothing read before the commit stays cached.
+    """
+    _forget(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _forget(user_id))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.4 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0004_revoked_token"),
+        # Counters are recounted first, so drifted rows cannot fail the check
+        ("borrowings", "0010_backfill_active_loans"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="user",
+            constraint=models.CheckConstraint(
+                check=models.Q(("active_loans__gte", 0)),
+                name="users_user_active_loans_gte_0",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+def revoke_users_by_token_version(apps, schema_editor):
+    """Rows without a jti revoked all tokens of a user, the version does that now"""
+    RevokedToken = apps.get_model("users", "RevokedToken")
+    User = apps.get_model("users", "User")
+    rows = RevokedToken.objects.filter(jti="")
+    User.objects.filter(pk__in=rows.values("user_id")).update(
+        token_version=models.F("token_version") + 1
+    )
+    rows.delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_active_loans_gte_0"),
+    ]
+
+    operations = [
+        migrations.RunPython(revoke_users_by_token_version, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="revokedtoken",
+            name="jti",
+            field=models.CharField(max_length=255),
+        ),
+    ]
@@ -3,8 +3,11 @@ from django.contrib.auth.models import (
     BaseUserManager,
 )
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
+from users.cache import forget_user
+
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
@@ -43,8 +46,84 @@ class UserManager(BaseUserManager):
 class User(AbstractUser):
     username = None
     email = models.EmailField(_("email address"), unique=True)
+    # Active borrowings, kept by the checkout and return transactions
+    active_loans = models.IntegerField(default=0, editable=False)
+    # Goes up when the staff/active flags or the password change,
+    # tokens carrying an older version stop working
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
+    TOKEN_STATE_FIELDS = ("is_staff", "is_superuser", "is_active", "password")
 
     objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(active_loans__gte=0),
+                name="users_user_active_loans_gte_0",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_token_state = user.token_state()
+        return user
+
+    def token_state(self) -> dict:
+        # Deferred fields are left out instead of being loaded
+        return {
+            field: self.__dict__[field]
+            for field in self.TOKEN_STATE_FIELDS
+            if field in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):
+        """
+        token_version and active_loans only change through UPDATEs of their
+        own, so saving a stale instance never writes an older value back
+        """
+        loaded = getattr(self, "_loaded_token_state", {})
+        changed = any(
+            self.__dict__.get(field, value) != value for field, value in loaded.items()
+        )
+        if not self._state.adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.attname
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs["update_fields"] = [
+                field
+                for field in update_fields
+                if field not in ("token_version", "active_loans")
+            ]
+
+        super().save(*args, **kwargs)
+        if changed:
+            User.objects.filter(pk=self.pk).update(
+                token_version=models.F("token_version") + 1
+            )
+            self.refresh_from_db(fields=["token_version"])
+        self._loaded_token_state = self.token_state()
+        forget_user(self.pk)
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked token, by jti. Revoking every token of a user moves their
+    token_version on instead. Rows can be purged once expires_at passes.
+    """
+
+    jti = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Revoked {self.jti or 'all tokens'} of {self.user_id}"
@@ -0,0 +1,119 @@
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from users.cache import forget_user
+from users.models import RevokedToken
+
+# Rows committed late by a slow transaction are still picked up if their
+# created_at is at most this much older than the last refresh
+REFRESH_OVERLAP = datetime.timedelta(minutes=1)
+# Expired rows only leave memory on a full reload
+FULL_RELOAD_INTERVAL = 60 * 60
+
+
+def _refresh_interval() -> float:
+    return getattr(settings, "TOKEN_REVOCATION_REFRESH_INTERVAL", 5)
+
+
+class RevocationList:
+    """
+    The jtis of revoked tokens that haven't expired yet, kept in memory by
+    every process. Checks ask the database at most every
+    TOKEN_REVOCATION_REFRESH_INTERVAL seconds, and only for rows created
+    since the previous refresh.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self.jtis = set()
+        self.seen_until = None
+        self.refreshed_at = None
+        self.loaded_at = None
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if self.refreshed_at is not None:
+            if now - self.refreshed_at < _refresh_interval():
+                return
+        # Only one thread refreshes, the others check against what is loaded.
+        # Before the first load there is nothing to check against, so wait.
+        if not self.lock.acquire(blocking=self.loaded_at is None):
+            return
+        try:
+            # Another thread may have loaded the list while this one waited
+            if (
+                self.refreshed_at is None
+                or now - self.refreshed_at >= _refresh_interval()
+            ):
+                self._refresh(now)
+        finally:
+            self.lock.release()
+
+    def _refresh(self, now) -> None:
+        started = timezone.now()
+        rows = RevokedToken.objects.filter(expires_at__gt=started)
+        jtis = rows.values_list("jti", flat=True)
+        if self.loaded_at is None or now - self.loaded_at >= FULL_RELOAD_INTERVAL:
+            # Built aside and swapped in, checks never see a half loaded list
+            self.jtis = set(jtis)
+            self.loaded_at = now
+        else:
+            self.jtis.update(
+                jtis.filter(created_at__gte=self.seen_until - REFRESH_OVERLAP)
+            )
+        self.seen_until = started
+        self.refreshed_at = now
+
+    def is_revoked(self, token) -> bool:
+        self.refresh()
+        return token.get(api_settings.JTI_CLAIM) in self.jtis
+
+
+revocation_list = RevocationList()
+
+
+def _expires_at(timestamp) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def revoke_tokens(tokens) -> None:
+    """Revokes the given validated tokens by their jti"""
+    revoked = RevokedToken.objects.bulk_create(
+        [
+            RevokedToken(
+                jti=token[api_settings.JTI_CLAIM],
+                user_id=int(token[api_settings.USER_ID_CLAIM]),
+                expires_at=_expires_at(token["exp"]),
+            )
+            for token in tokens
+        ]
+    )
+    revocation_list.jtis.update(row.jti for row in revoked)
+
+
+def revoke_user(user_id) -> None:
+    """
+    Revokes every token the user has been issued so far by moving their
+    token version on. Tokens issued right after carry the new version,
+    however close in time they are.
+    """
+    get_user_model().objects.filter(pk=user_id).update(
+        token_version=F("token_version") + 1
+    )
+    forget_user(user_id)
+
+
+def purge_expired() -> int:
+    """Deletes rows of tokens that expired anyway, returns how many"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,5 +1,15 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.authentication import (
+    add_user_claims,
+    check_not_revoked,
+    check_token_version,
+)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -26,4 +36,50 @@ class UserSerializer(serializers.ModelSerializer):
 
 class UserListUpdateSerializer(UserSerializer):
     class Meta(UserSerializer.Meta):
-        fields = ("id", "email", "password", "first_name", "last_name", "is_staff",)
+        fields = (
+            "id",
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "is_staff",
+            "active_loans",
+        )
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """Adds the is_staff and token version claims StatelessJWTAuthentication reads"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """Revoked refresh tokens and ones issued before a demotion can't be used"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        check_not_revoked(refresh)
+        check_token_version(refresh)
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+    all = serializers.BooleanField(
+        default=False, help_text="Revoke every token issued to the user so far"
+    )
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as error:
+            raise serializers.ValidationError(str(error))
+
+        user = self.context["request"].user
+        if str(refresh[api_settings.USER_ID_CLAIM]) != str(user.id):
+            raise serializers.ValidationError(
+                "The refresh token belongs to another user."
+            )
+        return refresh
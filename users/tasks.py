@@ -0,0 +1,7 @@
+from jobs.registry import task
+from users.revocation import purge_expired
+
+
+@task("users.purge_revoked_tokens")
+def purge_revoked_tokens():
+    purge_expired()
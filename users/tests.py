@@ -1,3 +1,301 @@
+import datetime
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from books.models import Book
+from users.models import RevokedToken
+from users.revocation import purge_expired, revocation_list
+
+TOKEN_URL = reverse("users:token_obtain_pair")
+TOKEN_REFRESH_URL = reverse("users:token_refresh")
+TOKEN_REVOKE_URL = reverse("users:token_revoke")
+ME_URL = reverse("users:manage")
+BORROWINGS_URL = reverse("borrowings:borrowings-list")
+BALANCES_URL = reverse("borrowings:borrowings-balances")
+
+
+def user_queries(queries):
+    """Lookups of a single user by id, as the authentication would do"""
+    lookup = 'FROM "users_user" WHERE "users_user"."id" ='
+    return [query for query in queries if lookup in query["sql"]]
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revocation_list.clear()
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_user(
+            "staff@test.com", "testpass", is_staff=True
+        )
+
+    def login(self, email="staff@test.com", password="testpass"):
+        res = self.client.post(TOKEN_URL, {"email": email, "password": password})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def authenticate(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_token_carries_staff_and_version_claims(self):
+        access = AccessToken(self.login()["access"])
+
+        self.assertEqual(int(access["user_id"]), self.staff.id)
+        self.assertTrue(access["is_staff"])
+        self.assertEqual(access["ver"], 0)
+
+    def test_requests_do_not_query_the_user(self):
+        self.authenticate(self.login()["access"])
+        self.client.get(BALANCES_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(BALANCES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(user_queries(queries.captured_queries), [])
+
+    def test_demoted_staff_token_is_rejected(self):
+        self.authenticate(self.login()["access"])
+        self.assertEqual(self.client.get(BALANCES_URL).status_code, 200)
+
+        self.staff.is_staff = False
+        self.staff.save()
+
+        res = self.client.get(BALANCES_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.authenticate(self.login()["access"])
+        res = self.client.get(BALANCES_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_password_change_rejects_old_refresh_token(self):
+        refresh = self.login()["refresh"]
+
+        self.staff.set_password("newpass")
+        self.staff.save()
+
+        res = self.client.post(TOKEN_REFRESH_URL, {"refresh": refresh})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_unrelated_changes_keep_tokens_valid(self):
+        self.authenticate(self.login()["access"])
+
+        self.staff.first_name = "Name"
+        self.staff.save()
+
+        self.assertEqual(self.client.get(BALANCES_URL).status_code, 200)
+
+    def test_stale_instance_does_not_lower_token_version(self):
+        stale = get_user_model().objects.get(pk=self.staff.pk)
+        self.staff.is_staff = False
+        self.staff.save()
+
+        stale.last_name = "Name"
+        stale.save()
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.token_version, 1)
+
+    def test_profile_uses_the_full_user(self):
+        self.authenticate(self.login()["access"])
+
+        res = self.client.patch(ME_URL, {"first_name": "Name"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], "staff@test.com")
+        self.staff.refresh_from_db()
+        self.assertEqual(self.staff.first_name, "Name")
+
+    def test_claims_user_reads_other_fields_from_cached_user(self):
+        self.authenticate(self.login()["access"])
+        res = self.client.get(BORROWINGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        request_user = res.wsgi_request.user
+        self.assertEqual(request_user.email, "staff@test.com")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(request_user.email, "staff@test.com")
+        self.assertEqual(queries.captured_queries, [])
+
+    def test_owner_reads_own_borrowing(self):
+        get_user_model().objects.create_user("user@test.com", "testpass")
+        book = Book.objects.create(
+            title="Title", cover="HARD", inventory=1, daily_fee=1
+        )
+        self.authenticate(self.login("user@test.com")["access"])
+        res = self.client.post(
+            BORROWINGS_URL,
+            {
+                "book": book.id,
+                "expected_return_date": datetime.date.today()
+                + datetime.timedelta(days=3),
+            },
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.get(
+            reverse("borrowings:borrowings-detail", args=[res.data["id"]])
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_token_without_claims_falls_back_to_user_lookup(self):
+        refresh = RefreshToken()
+        refresh["user_id"] = self.staff.id
+        self.authenticate(refresh.access_token)
+
+        self.assertEqual(self.client.get(BALANCES_URL).status_code, 200)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revocation_list.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user("user@test.com", "testpass")
+
+    def login(self):
+        res = self.client.post(
+            TOKEN_URL, {"email": "user@test.com", "password": "testpass"}
+        )
+        return res.data["access"], res.data["refresh"]
+
+    def authenticate(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_revoke_access_and_refresh_token(self):
+        access, refresh = self.login()
+        other_access, _ = self.login()
+        self.authenticate(access)
+
+        res = self.client.post(TOKEN_REVOKE_URL, {"refresh": refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        res = self.client.post(TOKEN_REFRESH_URL, {"refresh": refresh})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.authenticate(other_access)
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+    def test_revoke_all_tokens_of_user(self):
+        access, refresh = self.login()
+        other_access, _ = self.login()
+        self.authenticate(access)
+
+        res = self.client.post(TOKEN_REVOKE_URL, {"all": True})
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.authenticate(other_access)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        res = self.client.post(TOKEN_REFRESH_URL, {"refresh": refresh})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_right_after_revoking_all_tokens(self):
+        access, _ = self.login()
+        self.authenticate(access)
+        self.client.post(TOKEN_REVOKE_URL, {"all": True})
+
+        new_access, new_refresh = self.login()
+
+        self.authenticate(new_access)
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+        res = self.client.post(TOKEN_REFRESH_URL, {"refresh": new_refresh})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.authenticate(access)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_revoke_all_covers_tokens_without_version_claim(self):
+        refresh = RefreshToken()
+        refresh["user_id"] = self.user.id
+        self.authenticate(refresh.access_token)
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        self.client.post(TOKEN_REVOKE_URL, {"all": True})
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        res = self.client.post(TOKEN_REFRESH_URL, {"refresh": str(refresh)})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cannot_revoke_refresh_token_of_another_user(self):
+        other = get_user_model().objects.create_user("other@test.com", "testpass")
+        access, _ = self.login()
+        self.authenticate(access)
+
+        res = self.client.post(
+            TOKEN_REVOKE_URL, {"refresh": str(RefreshToken.for_user(other))}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_revocations_of_other_processes_are_loaded_incrementally(self):
+        access, _ = self.login()
+        self.authenticate(access)
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        token = AccessToken(access)
+        RevokedToken.objects.create(
+            jti=token["jti"],
+            user=self.user,
+            expires_at=timezone.now() + datetime.timedelta(hours=1),
+        )
+        revocation_list.refreshed_at -= 60
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(revocation_list.is_revoked(token))
+        self.assertIn('"created_at" >=', queries.captured_queries[0]["sql"])
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_first_check_waits_for_a_load_in_progress(self):
+        token = AccessToken(self.login()[0])
+        results = []
+        revocation_list.lock.acquire()
+        checker = threading.Thread(
+            target=lambda: results.append(revocation_list.is_revoked(token))
+        )
+        checker.start()
+        checker.join(0.2)
+        self.assertTrue(checker.is_alive())
+
+        # Finish the load the checker is waiting for
+        revocation_list.jtis = {token["jti"]}
+        revocation_list.refreshed_at = revocation_list.loaded_at = time.monotonic()
+        revocation_list.lock.release()
+        checker.join()
+
+        self.assertEqual(results, [True])
+
+    def test_checks_between_refreshes_do_not_query(self):
+        access, _ = self.login()
+        token = AccessToken(access)
+        revocation_list.is_revoked(token)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(revocation_list.is_revoked(token))
+        self.assertEqual(queries.captured_queries, [])
+
+    def test_purge_expired(self):
+        RevokedToken.objects.create(
+            jti="expired", user=self.user, expires_at=timezone.now()
+        )
+        RevokedToken.objects.create(
+            jti="valid",
+            user=self.user,
+            expires_at=timezone.now() + datetime.timedelta(hours=1),
+        )
 
-# Create your tests here.
+        self.assertEqual(purge_expired(), 1)
+        self.assertEqual(
+            list(RevokedToken.objects.values_list("jti", flat=True)), ["valid"]
+        )
@@ -1,8 +1,14 @@
-from rest_framework import generics
+from django.contrib.auth import get_user_model
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.response import Response
 
-from users.serializers import UserSerializer, UserListUpdateSerializer
+from users.revocation import revoke_tokens, revoke_user
+from users.serializers import (
+    TokenRevokeSerializer,
+    UserSerializer,
+    UserListUpdateSerializer,
+)
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -11,8 +17,29 @@ class CreateUserView(generics.CreateAPIView):
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserListUpdateSerializer
-    authentication_classes = (JWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
-        return self.request.user
+        # The request user only carries token claims, edits need the fresh row
+        return get_user_model().objects.get(pk=self.request.user.id)
+
+
+class RevokeTokenView(generics.GenericAPIView):
+    """
+    Logs out: revokes the access token of the request and the given
+    refresh token, or with all=true every token issued to the user so far
+    """
+
+    serializer_class = TokenRevokeSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if serializer.validated_data["all"]:
+            revoke_user(request.user.id)
+        else:
+            tokens = [serializer.validated_data.get("refresh"), request.auth]
+            revoke_tokens([token for token in tokens if token is not None])
+        return Response(status=status.HTTP_204_NO_CONTENT)